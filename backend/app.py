@@ -1,4 +1,4 @@
-from flask import Flask, request, make_response
+from flask import Flask, request, make_response, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
@@ -6,12 +6,22 @@ from flask_socketio import SocketIO
 from datetime import datetime
 from config import Config
 from models import db, Doctor
+from log import configure_logging, get_logger, sample_request
+from storage import UploadRequest
+from realtime import message_queue_options
+from fastjson import FastJSONProvider, SocketIOJSON
+import logging
 import os
 import threading
 import time
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.config.from_object(Config)
+app.request_class = UploadRequest
+
+configure_logging(app)
+logger = get_logger('app')
 
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -25,18 +35,20 @@ CORS(app, origins=["http://localhost:3000"])
 socketio = SocketIO(
     app, 
     cors_allowed_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
-    async_mode='threading',
-    logger=True,
-    engineio_logger=True,
+    async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+    logger=get_logger('socketio') if app.config['SOCKETIO_LOGGING'] else False,
+    engineio_logger=get_logger('engineio') if app.config['SOCKETIO_LOGGING'] else False,
     ping_timeout=60,
     ping_interval=25,
-    allow_upgrades=True
+    allow_upgrades=True,
+    json=SocketIOJSON,
+    **message_queue_options(app.config)
 )
 
 
 @app.before_request
 def handle_preflight():
-    print(f"Before request: {request.method} {request.path} from {request.headers.get('Origin')}")
+    g.request_started = time.perf_counter()
     if request.method == "OPTIONS":
         response = make_response()
         response.headers.add("Access-Control-Allow-Origin", "http://localhost:3000")
@@ -59,9 +71,20 @@ def after_request(response):
     response.headers['Access-Control-Allow-Credentials'] = 'true'
 
     
-    print(f"After request: {request.method} {request.path} - Status: {response.status_code}")
-    if response.status_code >= 400:
-        print(f"Error Response: {response.status_code} - {response.get_data(as_text=True)}")
+    # Errors are always logged; routine requests are sampled per route.
+    # Bodies are only materialized when debug logging is on.
+    is_error = response.status_code >= 400
+    if is_error or sample_request(request.path):
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - g.get('request_started', time.perf_counter())) * 1000, 2),
+            'origin': origin,
+        }
+        if is_error and logger.isEnabledFor(logging.DEBUG) and not response.is_streamed:
+            fields['body'] = response.get_data(as_text=True)
+        logger.log(logging.WARNING if is_error else logging.INFO, "request", extra=fields)
 
     return response
 
@@ -69,12 +92,23 @@ def after_request(response):
 with app.app_context():
     try:
         db.engine.connect()
-        print("Connected to database:", app.config['SQLALCHEMY_DATABASE_URI'])
+        logger.info("Connected to database: %s", db.engine.url.render_as_string(hide_password=True))
         
         db.create_all()
-        print("Database tables created successfully")
+        logger.info("Database tables created successfully")
+
+        from migrations import ensure_columns, ensure_indexes, backfill_availability
+        added_columns = ensure_columns()
+        if added_columns:
+            logger.info("Added missing columns: %s", added_columns)
+        created_indexes = ensure_indexes()
+        if created_indexes:
+            logger.info("Created missing indexes: %s", created_indexes)
+        converted = backfill_availability()
+        if converted:
+            logger.info("Backfilled availability rows for %d doctors", converted)
     except Exception as e:
-        print(f"Database Error: {e}")
+        logger.error("Database Error: %s", e)
 
 
 from routes import bp as auth_bp
@@ -84,24 +118,25 @@ app.register_blueprint(auth_bp)
 from socket_handlers import init_socket_handlers
 init_socket_handlers(socketio, app, {}, {})
 
+from notifications import init_notifications
+init_notifications(socketio)
+
 
-print("\n=== REGISTERED ROUTES ===")
-for rule in app.url_map.iter_rules():
-    print(f"{rule.endpoint}: {rule.rule} [{', '.join(rule.methods)}]")
-print("========================\n")
+if logger.isEnabledFor(logging.DEBUG):
+    for rule in app.url_map.iter_rules():
+        logger.debug("Registered route %s: %s [%s]", rule.endpoint, rule.rule, ', '.join(rule.methods))
 
 
 @app.errorhandler(500)
 def internal_error(error):
-    print(f"500 Error: {error}")
+    logger.error("500 Error: %s", error)
     response = make_response({"error": "Internal server error"}, 500)
     response.headers['Access-Control-Allow-Origin'] = 'http://localhost:3000'
     return response
 
 @app.errorhandler(404)
 def not_found(error):
-    print(f"404 Error: {error}")
-    print(f"Requested URL: {request.url}")
+    logger.warning("404 Error: %s", error, extra={'url': request.url})
     response = make_response({"error": "Not found"}, 404)
     response.headers['Access-Control-Allow-Origin'] = 'http://localhost:3000'
     return response
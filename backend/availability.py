@@ -0,0 +1,158 @@
+"""Doctor weekly availability.
+
+Stored as doctor_availability rows (weekday, start_minute, end_minute) so SQL
+can answer "who works Tuesday at 10:00"; read through a per-process cache of
+the compiled form {weekday_index: [(start_minute, end_minute)]}. The API still
+speaks the original {"Monday": ["09:00-17:00"]} JSON, and Doctor.availability
+keeps a canonical copy of it for older readers.
+"""
+from flask import current_app
+from models import db, DoctorAvailability
+from sqlalchemy import delete, insert, select
+import json
+import threading
+import time
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# doctor_id -> (compiled availability, loaded_at)
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _minute_of_day(clock):
+    """'HH:MM' -> minutes since midnight; 24:00 is allowed as an end time"""
+    try:
+        hours, minutes = (int(part) for part in clock.strip().split(':'))
+    except ValueError:
+        raise ValueError(f"Invalid time: {clock.strip()!r}")
+    if not (0 <= minutes <= 59 and 0 <= hours * 60 + minutes <= 24 * 60):
+        raise ValueError(f"Invalid time: {clock.strip()!r}")
+    return hours * 60 + minutes
+
+
+def parse_time_ranges(time_ranges):
+    """Turn ["HH:MM-HH:MM", ...] into sorted (start_minute, end_minute) tuples"""
+    if time_ranges is None:
+        return []
+    if not isinstance(time_ranges, list):
+        raise ValueError("Time ranges must be a list")
+    ranges = []
+    for time_range in time_ranges:
+        if not isinstance(time_range, str):
+            raise ValueError(f"Invalid time range: {time_range!r}")
+        if time_range.strip() in ('', '-'):
+            continue
+        try:
+            start, end = time_range.split('-')
+        except ValueError:
+            raise ValueError(f"Invalid time range: {time_range!r}")
+        start_minute = _minute_of_day(start)
+        end_minute = _minute_of_day(end)
+        if start_minute < end_minute:
+            ranges.append((start_minute, end_minute))
+    ranges.sort()
+    return ranges
+
+
+def compile_availability(availability):
+    """Compile availability JSON (str or dict) into {weekday_index: [(start_minute, end_minute)]}.
+
+    Raises ValueError on malformed input.
+    """
+    if isinstance(availability, str):
+        availability = json.loads(availability) if availability else {}
+    if not isinstance(availability, dict):
+        raise ValueError("Availability must be an object of day -> time ranges")
+    compiled = {}
+    for day, time_ranges in availability.items():
+        if day not in WEEKDAYS:
+            continue
+        ranges = parse_time_ranges(time_ranges)
+        if ranges:
+            compiled[WEEKDAYS.index(day)] = ranges
+    return compiled
+
+
+def format_availability(compiled):
+    """Compiled form back to the API's {"Monday": ["09:00-17:00"]} shape, in weekday order"""
+    return {
+        WEEKDAYS[weekday]: [
+            f"{start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}"
+            for start, end in compiled[weekday]
+        ]
+        for weekday in sorted(compiled)
+    }
+
+
+def set_availability(doctor, availability):
+    """Replace a doctor's rows (and the JSON copy); the caller commits, then calls invalidate_availability"""
+    compiled = compile_availability(availability)
+    db.session.execute(delete(DoctorAvailability).where(DoctorAvailability.doctor_id == doctor.id))
+    rows = [
+        {'doctor_id': doctor.id, 'weekday': weekday, 'start_minute': start, 'end_minute': end}
+        for weekday, ranges in compiled.items()
+        for start, end in ranges
+    ]
+    if rows:
+        db.session.execute(insert(DoctorAvailability), rows)
+    doctor.availability = json.dumps(format_availability(compiled))
+    return compiled
+
+
+def get_availability(doctor_ids):
+    """{doctor_id: compiled availability} for many doctors; one query for the cache misses"""
+    ttl = current_app.config.get('AVAILABILITY_CACHE_TTL')
+    now = time.monotonic()
+    result, missing = {}, []
+    with _cache_lock:
+        for doctor_id in doctor_ids:
+            entry = _cache.get(doctor_id)
+            if entry and (not ttl or now - entry[1] < ttl):
+                result[doctor_id] = entry[0]
+            else:
+                missing.append(doctor_id)
+
+    if missing:
+        loaded = {doctor_id: {} for doctor_id in missing}
+        rows = db.session.execute(
+            select(
+                DoctorAvailability.doctor_id, DoctorAvailability.weekday,
+                DoctorAvailability.start_minute, DoctorAvailability.end_minute
+            )
+            .where(DoctorAvailability.doctor_id.in_(missing))
+            .order_by(DoctorAvailability.start_minute)
+        )
+        for doctor_id, weekday, start, end in rows:
+            loaded[doctor_id].setdefault(weekday, []).append((start, end))
+        with _cache_lock:
+            for doctor_id, compiled in loaded.items():
+                _cache[doctor_id] = (compiled, now)
+        result.update(loaded)
+    return result
+
+
+def availability_json(doctor_id, fresh=False):
+    """API shape for one doctor; fresh=True skips this process's cache (for version-tagged responses)"""
+    if fresh:
+        invalidate_availability(doctor_id)
+    return format_availability(get_availability([doctor_id])[doctor_id])
+
+
+def invalidate_availability(doctor_id):
+    with _cache_lock:
+        _cache.pop(doctor_id, None)
+
+
+def available_at(weekday, start_minute=None, end_minute=None):
+    """Subquery of doctor ids whose hours cover [start_minute, end_minute) on a weekday.
+
+    Without start_minute, any hours on that weekday match.
+    """
+    query = select(DoctorAvailability.doctor_id).where(DoctorAvailability.weekday == weekday)
+    if start_minute is None:
+        return query
+    return query.where(
+        DoctorAvailability.start_minute <= start_minute,
+        DoctorAvailability.end_minute >= (end_minute if end_minute is not None else start_minute + 1)
+    )
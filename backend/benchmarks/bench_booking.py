@@ -0,0 +1,136 @@
+"""Hammer the booking endpoint with concurrent patients and check for double-bookings.
+
+Every thread books random slots from a small grid, so most attempts collide.
+--hot-share of the attempts target one popular doctor; the rest spread over
+the others. Afterwards the appointments table is checked for overlapping
+pending/accepted rows, which must be zero.
+
+    python benchmarks/bench_booking.py --concurrency 16 --attempts 2000 --slots 40
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from common import use_sqlite, load_app, seed, summarize, write_results, compare, PASSWORD
+
+
+def count_double_bookings(app):
+    """Pairs of slot-holding appointments for the same doctor that overlap"""
+    from sqlalchemy import and_
+    from sqlalchemy.orm import aliased
+    from models import db, Appointment
+    from booking import BLOCKING_STATUSES
+
+    other = aliased(Appointment)
+    with app.app_context():
+        return (
+            db.session.query(Appointment.id)
+            .join(other, and_(
+                other.doctor_id == Appointment.doctor_id,
+                other.id > Appointment.id,
+                other.start_time < Appointment.end_time,
+                other.end_time > Appointment.start_time
+            ))
+            .filter(Appointment.status.in_(BLOCKING_STATUSES), other.status.in_(BLOCKING_STATUSES))
+            .count()
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'smartcare-bench-booking.db'))
+    parser.add_argument('--doctors', type=int, default=10)
+    parser.add_argument('--patients', type=int, default=100)
+    parser.add_argument('--attempts', type=int, default=1000)
+    parser.add_argument('--slots', type=int, default=40, help='25-minute slots per doctor on the grid')
+    parser.add_argument('--hot-share', type=float, default=0.8, help='fraction of attempts on doctor 1')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='results JSON path (default: benchmarks/results/)')
+    parser.add_argument('--compare', help='previous results JSON to diff against')
+    args = parser.parse_args()
+
+    use_sqlite(args.db, BCRYPT_ROUNDS=4)
+    app, _ = load_app()
+    ids = seed(app, args.patients, args.doctors, appointments_per_doctor=0, messages_per_appointment=0)
+
+    client = app.test_client()
+    headers = [
+        {'Authorization': 'Bearer ' + client.post('/api/auth/login', json={
+            'email': email, 'password': PASSWORD}).get_json()['access_token']}
+        for email in ids['patient_emails'][:args.concurrency * 4]
+    ]
+
+    # Offset slots by a few minutes per attempt so partial overlaps are exercised too
+    base = datetime.utcnow().replace(second=0, microsecond=0) + timedelta(days=60)
+    rng = random.Random(args.seed)
+    plan = []
+    for _ in range(args.attempts):
+        doctor_id = 1 if rng.random() < args.hot_share else rng.choice(ids['doctor_ids'][1:] or [1])
+        start = base + timedelta(minutes=25 * rng.randrange(args.slots) + rng.choice((0, 0, 0, 10)))
+        plan.append((doctor_id, start))
+
+    samples, outcomes = [], {}
+    lock = threading.Lock()
+    counter = iter(range(args.attempts))
+
+    def worker(n):
+        c = app.test_client()
+        local = []
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            doctor_id, start = plan[i]
+            started = time.perf_counter()
+            response = c.post('/api/auth/patient/book-appointment', headers=headers[(n + i) % len(headers)], data={
+                'doctor_id': str(doctor_id),
+                'appointment_type': 'normal',
+                'start_time': start.isoformat(),
+                'end_time': (start + timedelta(minutes=25)).isoformat(),
+                'symptoms': 'bench',
+            })
+            local.append(time.perf_counter() - started)
+            with lock:
+                outcomes[response.status_code] = outcomes.get(response.status_code, 0) + 1
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    result = summarize(samples, wall)
+    booked = outcomes.get(201, 0)
+    result.update({
+        'booked': booked,
+        'rejected_taken': outcomes.get(400, 0),
+        'errors': sum(count for status, count in outcomes.items() if status not in (201, 400)),
+        'bookings_per_sec': round(booked / wall, 2) if wall else 0.0,
+        'double_bookings': count_double_bookings(app),
+    })
+    print(f"{args.attempts} attempts in {wall:.2f}s: {result['throughput_rps']} attempts/s, "
+          f"{result['bookings_per_sec']} bookings/s, p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms")
+    print(f"booked {booked}, slot taken {result['rejected_taken']}, errors {result['errors']}, "
+          f"double-bookings {result['double_bookings']}")
+
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    path = write_results('booking', config, {'booking': result}, args.output)
+    print(f"Results written to {path}")
+    if args.compare:
+        compare({'booking': result}, args.compare)
+    if result['double_bookings']:
+        raise SystemExit("Double-bookings detected")
+
+
+if __name__ == '__main__':
+    main()
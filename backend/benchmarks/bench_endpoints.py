@@ -0,0 +1,128 @@
+"""Drive the hot HTTP endpoints through the Flask test client against seeded SQLite.
+
+    python benchmarks/bench_endpoints.py --doctors 50 --patients 500 --requests 500
+    python benchmarks/bench_endpoints.py --compare benchmarks/results/endpoints-<rev>-<ts>.json
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from common import use_sqlite, load_app, seed, summarize, write_results, compare, PASSWORD
+
+
+def run(app, name, requests, concurrency, call, expected_status):
+    """Issue `requests` calls split across `concurrency` threads; each thread has its own client"""
+    samples = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        client = app.test_client()
+        local = []
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            started = time.perf_counter()
+            response = call(client, i)
+            local.append(time.perf_counter() - started)
+            if response.status_code != expected_status:
+                with lock:
+                    errors.append(response.status_code)
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(samples, time.perf_counter() - started)
+    result['errors'] = len(errors)
+    print(f"{name:<28} {result['throughput_rps']:>9} req/s  p50 {result['p50_ms']:>8} ms  "
+          f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  errors {result['errors']}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'smartcare-bench.db'))
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--appointments-per-doctor', type=int, default=200)
+    parser.add_argument('--messages-per-appointment', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=300, help='requests per endpoint')
+    parser.add_argument('--login-requests', type=int, default=30, help='bcrypt makes login much slower')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--bcrypt-rounds', type=int, default=12)
+    parser.add_argument('--output', help='results JSON path (default: benchmarks/results/)')
+    parser.add_argument('--compare', help='previous results JSON to diff against')
+    args = parser.parse_args()
+
+    use_sqlite(args.db, BCRYPT_ROUNDS=args.bcrypt_rounds)
+    app, _ = load_app()
+
+    started = time.perf_counter()
+    ids = seed(app, args.patients, args.doctors, args.appointments_per_doctor, args.messages_per_appointment)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s: {args.doctors} doctors, {args.patients} patients, "
+          f"{args.doctors * args.appointments_per_doctor} appointments")
+
+    client = app.test_client()
+
+    def token(email):
+        return client.post('/api/auth/login', json={'email': email, 'password': PASSWORD}).get_json()['access_token']
+
+    patient_headers = [{'Authorization': f"Bearer {token(email)}"} for email in ids['patient_emails'][:20]]
+    doctor_headers = [{'Authorization': f"Bearer {token(email)}"} for email in ids['doctor_emails'][:20]]
+    doctor_ids = ids['doctor_ids']
+    booking_base = datetime.utcnow().replace(second=0, microsecond=0) + timedelta(days=30)
+
+    def book(c, i):
+        # Distinct doctor/slot pairs so every booking is valid
+        start = booking_base + timedelta(minutes=25 * (i // len(doctor_ids)))
+        return c.post('/api/auth/patient/book-appointment', headers=patient_headers[i % len(patient_headers)], data={
+            'doctor_id': str(doctor_ids[i % len(doctor_ids)]),
+            'appointment_type': 'normal',
+            'start_time': start.isoformat(),
+            'end_time': (start + timedelta(minutes=25)).isoformat(),
+            'symptoms': 'bench',
+        })
+
+    scenarios = [
+        ('login', args.login_requests, lambda c, i: c.post('/api/auth/login', json={
+            'email': ids['patient_emails'][i % len(ids['patient_emails'])], 'password': PASSWORD}), 200),
+        ('patient_doctors', args.requests, lambda c, i: c.get(
+            '/api/auth/patient/doctors', headers=patient_headers[i % len(patient_headers)]), 200),
+        ('available_slots', args.requests, lambda c, i: c.get(
+            f"/api/auth/doctor/available-slots/{doctor_ids[i % len(doctor_ids)]}"), 200),
+        ('book_appointment', args.requests, book, 201),
+        ('doctor_appointments', args.requests, lambda c, i: c.get(
+            '/api/auth/doctor/appointments', headers=doctor_headers[i % len(doctor_headers)]), 200),
+    ]
+
+    results = {}
+    for name, requests, call, expected in scenarios:
+        results[name] = run(app, name, requests, args.concurrency, call, expected)
+
+    # A dashboard poll of an unchanged list revalidates its ETag and gets a 304
+    client = app.test_client()
+    etags = [client.get('/api/auth/doctor/appointments', headers=h).headers['ETag'] for h in doctor_headers]
+    results['doctor_appointments_304'] = run(app, 'doctor_appointments_304', args.requests, args.concurrency, lambda c, i: c.get(
+        '/api/auth/doctor/appointments',
+        headers={**doctor_headers[i % len(doctor_headers)], 'If-None-Match': etags[i % len(doctor_headers)]}), 304)
+
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    path = write_results('endpoints', config, results, args.output)
+    print(f"Results written to {path}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""Compare Socket.IO server runtimes under many idle and some chatting connections.
+
+Each mode starts serve.py in a subprocess against the same seeded SQLite file,
+opens --idle connections that only stay connected, then --active clients that
+join a chat session each and send --messages messages, timing every message
+from send to its receive-message echo. Memory per connection is the server's
+RSS growth while the idle connections are open (Linux /proc).
+
+Needs the benchmark-only client stack: pip install "python-socketio[asyncio_client]",
+plus eventlet and/or gevent for the cooperative modes.
+
+    python benchmarks/bench_realtime.py --modes threading gevent --idle 2000 --active 50
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from common import BACKEND_DIR, use_sqlite, load_app, seed, summarize, write_results, compare
+
+
+def rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def raise_fd_limit():
+    """Thousands of sockets need more descriptors than the usual 1024; the server inherits this"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def prepare(db_path, patients, active):
+    """Seed the database and mint tokens; returns (patient tokens, [(appointment_id, token)])"""
+    use_sqlite(db_path)
+    app, _ = load_app()
+    seed(app, patients=patients, doctors=10, appointments_per_doctor=max(1, active // 10 + 1), messages_per_appointment=0)
+
+    from flask_jwt_extended import create_access_token
+    from models import db, Appointment
+
+    with app.app_context():
+        def token(patient_id):
+            return create_access_token(identity=str(10 + patient_id), additional_claims={
+                'role': 'patient', 'doctor_id': None, 'patient_id': patient_id
+            })
+
+        sessions = Appointment.query.order_by(Appointment.id).limit(active).all()
+        for appointment in sessions:
+            appointment.status = 'accepted'
+            appointment.chat_active = True
+        db.session.commit()
+        return (
+            [token(patient_id) for patient_id in range(1, patients + 1)],
+            [(appointment.id, token(appointment.patient_id)) for appointment in sessions],
+        )
+
+
+def start_server(mode, db_path, port):
+    env = dict(os.environ, SOCKETIO_ASYNC_MODE=mode, DATABASE_URL=f"sqlite:///{db_path}", LOG_LEVEL='ERROR')
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, 'serve.py'), '--host', '127.0.0.1', '--port', str(port)],
+        cwd=BACKEND_DIR, env=env
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/api/auth/test", timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"{mode} server did not start on port {port}")
+
+
+async def connect_all(url, tokens, count, batch):
+    import socketio
+
+    clients = []
+    for start in range(0, count, batch):
+        group = [socketio.AsyncClient(reconnection=False) for _ in range(start, min(count, start + batch))]
+        await asyncio.gather(*[
+            client.connect(url, auth={'token': tokens[(start + n) % len(tokens)]}, transports=['websocket'])
+            for n, client in enumerate(group)
+        ])
+        clients.extend(group)
+    return clients
+
+
+async def chat(url, appointment_id, token, messages):
+    """Join one session and time each message until it comes back from the room"""
+    import socketio
+
+    client = socketio.AsyncClient(reconnection=False)
+    pending = {}
+    joined = asyncio.get_running_loop().create_future()
+
+    @client.on('previous_messages')
+    async def on_history(data):
+        if not joined.done():
+            joined.set_result(True)
+
+    @client.on('receive-message')
+    async def on_message(data):
+        waiter = pending.pop(data['message'], None)
+        if waiter and not waiter.done():
+            waiter.set_result(time.perf_counter())
+
+    await client.connect(url, auth={'token': token}, transports=['websocket'])
+    await client.emit('join-session', {'appointment_id': appointment_id})
+    await asyncio.wait_for(joined, 30)
+
+    samples = []
+    for n in range(messages):
+        text = f"bench {appointment_id} {n}"
+        pending[text] = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        await client.emit('send-message', {
+            'appointment_id': appointment_id, 'message': text, 'sender_type': 'patient', 'sender_id': 1
+        })
+        samples.append(await asyncio.wait_for(pending[text], 30) - started)
+    await client.disconnect()
+    return samples
+
+
+async def run_mode(mode, args, db_path, port, tokens, sessions):
+    url = f"http://127.0.0.1:{port}"
+    server = start_server(mode, db_path, port)
+    try:
+        await asyncio.sleep(1)
+        baseline = rss_kb(server.pid)
+        started = time.perf_counter()
+        idle = await connect_all(url, tokens, args.idle, args.connect_batch)
+        connect_seconds = time.perf_counter() - started
+        await asyncio.sleep(2)
+        loaded = rss_kb(server.pid)
+
+        started = time.perf_counter()
+        per_client = await asyncio.gather(*[chat(url, appointment_id, token, args.messages) for appointment_id, token in sessions])
+        samples = [sample for client in per_client for sample in client]
+        result = summarize(samples, time.perf_counter() - started)
+        result.update({
+            'idle_connections': len(idle),
+            'connect_seconds': round(connect_seconds, 2),
+            'rss_baseline_kb': baseline,
+            'rss_loaded_kb': loaded,
+            'kb_per_connection': round((loaded - baseline) / len(idle), 2) if idle else 0.0,
+        })
+        await asyncio.gather(*[client.disconnect() for client in idle], return_exceptions=True)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    print(f"{mode:<10} {result['kb_per_connection']:>8} KB/conn  {result['throughput_rps']:>9} msg/s  "
+          f"p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'smartcare-bench-realtime.db'))
+    parser.add_argument('--modes', nargs='+', default=['threading', 'gevent'], choices=['threading', 'eventlet', 'gevent'])
+    parser.add_argument('--idle', type=int, default=1000, help='connections that stay open without chatting')
+    parser.add_argument('--active', type=int, default=50, help='clients chatting in their own session')
+    parser.add_argument('--messages', type=int, default=20, help='messages per active client')
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--connect-batch', type=int, default=100)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output', help='results JSON path (default: benchmarks/results/)')
+    parser.add_argument('--compare', help='previous results JSON to diff against')
+    args = parser.parse_args()
+
+    print(f"File descriptor limit: {raise_fd_limit()}")
+    db_path = os.path.abspath(args.db)
+    tokens, sessions = prepare(db_path, args.patients, args.active)
+
+    results = {}
+    for offset, mode in enumerate(args.modes):
+        results[mode] = asyncio.run(run_mode(mode, args, db_path, args.port + offset, tokens, sessions))
+
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    path = write_results('realtime', config, results, args.output)
+    print(f"Results written to {path}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
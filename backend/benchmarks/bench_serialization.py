@@ -0,0 +1,112 @@
+"""Time encoding a large doctor appointment list, before and after the serializer layer.
+
+Rows are loaded once from a seeded database; only dict building plus the
+jsonify response encoding is timed. Three variants:
+
+  legacy             hand-built dicts with isoformat(), Flask's default provider
+  serializers_stdlib serializers.doctor_appointment, FastJSONProvider without orjson
+  serializers_orjson serializers.doctor_appointment, FastJSONProvider with orjson
+
+    python benchmarks/bench_serialization.py --appointments 5000 --repeat 50
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import use_sqlite, load_app, seed, summarize, write_results, compare
+
+
+def legacy_item(appt, patient, unread):
+    return {
+        "id": appt.id,
+        "patient": {
+            "id": patient.id,
+            "name": patient.name,
+            "age": patient.age,
+            "gender": patient.gender,
+            "medical_history": patient.medical_history
+        },
+        "appointment_type": appt.appointment_type,
+        "start_time": appt.start_time.isoformat(),
+        "end_time": appt.end_time.isoformat(),
+        "status": appt.status,
+        "symptoms": appt.symptoms,
+        "report_file": appt.report_file,
+        "unread_count": unread
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'smartcare-bench-serialization.db'))
+    parser.add_argument('--appointments', type=int, default=5000, help='rows in the encoded list')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--output', help='results JSON path (default: benchmarks/results/)')
+    parser.add_argument('--compare', help='previous results JSON to diff against')
+    args = parser.parse_args()
+
+    use_sqlite(args.db)
+    app, _ = load_app()
+    seed(app, patients=200, doctors=1, appointments_per_doctor=args.appointments, messages_per_appointment=0)
+
+    from flask.json.provider import DefaultJSONProvider
+    from fastjson import FastJSONProvider, orjson
+    from models import db, Appointment, Patient
+    from serializers import doctor_appointment
+
+    default_json = DefaultJSONProvider(app)
+    fast_json = FastJSONProvider(app)
+
+    with app.app_context():
+        rows = (
+            db.session.query(Appointment, Patient)
+            .join(Patient, Appointment.patient_id == Patient.id)
+            .order_by(Appointment.start_time.desc())
+            .all()
+        )
+
+        def legacy():
+            return default_json.response({"pending": [legacy_item(appt, patient, 0) for appt, patient in rows]})
+
+        def serializers_stdlib():
+            # The provider's fallback path, as used when orjson is not installed
+            return DefaultJSONProvider.response(
+                fast_json, {"pending": [doctor_appointment(appt, patient, 0) for appt, patient in rows]})
+
+        def serializers_orjson():
+            return fast_json.response({"pending": [doctor_appointment(appt, patient, 0) for appt, patient in rows]})
+
+        variants = {'legacy': legacy, 'serializers_stdlib': serializers_stdlib}
+        if orjson is not None:
+            variants['serializers_orjson'] = serializers_orjson
+
+        results = {}
+        for name, encode in variants.items():
+            encode()  # warm-up
+            samples = []
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                response = encode()
+                samples.append(time.perf_counter() - t)
+            results[name] = summarize(samples, time.perf_counter() - started)
+            results[name]['bytes'] = len(response.get_data())
+
+    baseline = results['legacy']['p50_ms']
+    print(f"{len(rows)} appointments, {args.repeat} runs each (orjson {'on' if orjson else 'not installed'})")
+    for name, result in results.items():
+        change = (result['p50_ms'] - baseline) / baseline * 100 if baseline else 0.0
+        print(f"  {name:<20} p50 {result['p50_ms']:>9} ms  p95 {result['p95_ms']:>9} ms  "
+              f"{result['bytes']:>9} bytes  ({change:+.1f}% vs legacy)")
+
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    config['orjson'] = orjson is not None
+    path = write_results('serialization', config, results, args.output)
+    print(f"Results written to {path}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Shared helpers for the backend benchmarks.
+
+The app in backend/app.py configures itself at import time, so point it at a
+scratch SQLite file with use_sqlite() *before* calling load_app().
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'results')
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+PASSWORD = 'bench-password'
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def use_sqlite(db_path, fresh=True, **config):
+    """Point the app at a SQLite file; extra kwargs become config env vars"""
+    if fresh and os.path.exists(db_path):
+        os.remove(db_path)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.abspath(db_path)}"
+    os.environ.setdefault('LOG_LEVEL', 'ERROR')
+    for key, value in config.items():
+        os.environ[key] = str(value)
+
+
+def load_app():
+    from app import app, socketio
+    return app, socketio
+
+
+def seed(app, patients=200, doctors=50, appointments_per_doctor=200, messages_per_appointment=5, rng_seed=42):
+    """Bulk-insert a deterministic dataset; returns ids the benchmarks need"""
+    from sqlalchemy import insert
+    from models import db, User, Patient, Doctor, DoctorAvailability, Appointment, ChatMessage
+    from passwords import hash_password
+
+    rng = random.Random(rng_seed)
+    with app.app_context():
+        password = hash_password(PASSWORD)
+        users = [
+            {'id': i + 1, 'email': f'doctor{i}@bench.test', 'password': password, 'role': 'doctor', 'is_active': True}
+            for i in range(doctors)
+        ] + [
+            {'id': doctors + i + 1, 'email': f'patient{i}@bench.test', 'password': password, 'role': 'patient', 'is_active': True}
+            for i in range(patients)
+        ] + [
+            {'id': doctors + patients + 1, 'email': 'admin@bench.test', 'password': password, 'role': 'admin', 'is_active': True}
+        ]
+        db.session.execute(insert(User), users)
+
+        availability = json.dumps({day: ['09:00-17:00'] for day in WEEKDAYS[:5]})
+        db.session.execute(insert(Doctor), [
+            {
+                'id': i + 1, 'user_id': i + 1, 'name': f'Doctor {i}',
+                'specialization': rng.choice(['Cardiology', 'Dermatology', 'Neurology', 'Pediatrics']),
+                'is_approved': True, 'availability': availability,
+                'pricing': float(rng.randint(20, 200)), 'instant_available': rng.random() < 0.3
+            }
+            for i in range(doctors)
+        ])
+        db.session.execute(insert(DoctorAvailability), [
+            {'doctor_id': i + 1, 'weekday': weekday, 'start_minute': 9 * 60, 'end_minute': 17 * 60}
+            for i in range(doctors)
+            for weekday in range(5)
+        ])
+        db.session.execute(insert(Patient), [
+            {'id': i + 1, 'user_id': doctors + i + 1, 'name': f'Patient {i}', 'age': rng.randint(18, 90)}
+            for i in range(patients)
+        ])
+
+        # History goes backwards from today in 25-minute steps so nothing overlaps
+        base = datetime.utcnow().replace(hour=9, minute=0, second=0, microsecond=0)
+        appointments = []
+        for doctor_id in range(1, doctors + 1):
+            for n in range(appointments_per_doctor):
+                start = base - timedelta(minutes=25 * (n + 1))
+                appointments.append({
+                    'patient_id': rng.randint(1, patients), 'doctor_id': doctor_id,
+                    'appointment_type': 'normal', 'start_time': start,
+                    'end_time': start + timedelta(minutes=25),
+                    'status': rng.choice(['accepted', 'accepted', 'pending', 'rejected']),
+                    'symptoms': 'bench'
+                })
+        for chunk in range(0, len(appointments), 5000):
+            db.session.execute(insert(Appointment), appointments[chunk:chunk + 5000])
+
+        messages = []
+        for appointment_id in range(1, len(appointments) + 1):
+            for n in range(messages_per_appointment):
+                messages.append({
+                    'appointment_id': appointment_id, 'sender_type': 'patient' if n % 2 else 'doctor',
+                    'sender_id': 1, 'message': f'message {n}',
+                    'sent_at': base - timedelta(seconds=appointment_id * 60 - n)
+                })
+        for chunk in range(0, len(messages), 5000):
+            db.session.execute(insert(ChatMessage), messages[chunk:chunk + 5000])
+        db.session.commit()
+
+    return {
+        'doctor_ids': list(range(1, doctors + 1)),
+        'patient_emails': [f'patient{i}@bench.test' for i in range(patients)],
+        'doctor_emails': [f'doctor{i}@bench.test' for i in range(doctors)],
+        'admin_email': 'admin@bench.test',
+    }
+
+
+def summarize(samples, wall_seconds):
+    """Throughput and latency percentiles (ms) for a list of per-request seconds"""
+    ordered = sorted(samples)
+
+    def pct(p):
+        if not ordered:
+            return 0.0
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))] * 1000, 3)
+
+    return {
+        'requests': len(ordered),
+        'throughput_rps': round(len(ordered) / wall_seconds, 2) if wall_seconds else 0.0,
+        'p50_ms': pct(50),
+        'p95_ms': pct(95),
+        'p99_ms': pct(99),
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def write_results(name, config, results, output=None):
+    """Save a run as JSON so runs from different commits can be diffed"""
+    revision = git_revision()
+    path = output or os.path.join(RESULTS_DIR, f"{name}-{revision}-{int(time.time())}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({
+            'benchmark': name,
+            'revision': revision,
+            'timestamp': datetime.utcnow().isoformat(),
+            'config': config,
+            'results': results,
+        }, f, indent=2)
+    return path
+
+
+def compare(results, baseline_path):
+    """Print p50/p95/throughput deltas against a previous results file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            if before.get(metric):
+                change = (current[metric] - before[metric]) / before[metric] * 100
+                print(f"  {name:<28} {metric:<15} {before[metric]:>10} -> {current[metric]:>10} ({change:+.1f}%)")
@@ -0,0 +1,83 @@
+from models import db, Doctor, Appointment
+from log import get_logger
+from versions import bump_appointment_lists
+from sqlalchemy import select, update
+from sqlalchemy.exc import OperationalError
+import random
+import time
+
+logger = get_logger('booking')
+
+# Appointments that hold their time slot; a rejected request frees it again
+BLOCKING_STATUSES = ('pending', 'accepted')
+
+# Lock conflicts worth retrying: MySQL deadlock / lock wait timeout, SQLite busy
+_LOCK_CONFLICT_CODES = {1205, 1213}
+
+
+class SlotTaken(Exception):
+    """The requested time overlaps an appointment that holds the slot"""
+
+
+def _is_lock_conflict(error):
+    orig = getattr(error, 'orig', None)
+    code = orig.args[0] if orig is not None and orig.args else None
+    return code in _LOCK_CONFLICT_CODES or 'database is locked' in str(orig)
+
+
+def lock_doctor(doctor_id):
+    """Serialize bookings for one doctor until the transaction ends.
+
+    MySQL/PostgreSQL take a row lock on the doctor, so bookings for other
+    doctors proceed in parallel. SQLite has no row locks; a no-op UPDATE takes
+    its write lock up front instead of at INSERT time, where two transactions
+    that both read first would deadlock.
+    """
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(update(Doctor).where(Doctor.id == doctor_id).values(id=Doctor.id))
+    else:
+        db.session.execute(select(Doctor.id).where(Doctor.id == doctor_id).with_for_update())
+
+
+def find_overlap(doctor_id, start_dt, end_dt):
+    return (
+        Appointment.query
+        .with_entities(Appointment.id)
+        .filter(
+            Appointment.doctor_id == doctor_id,
+            Appointment.status.in_(BLOCKING_STATUSES),
+            Appointment.start_time < end_dt,
+            Appointment.end_time > start_dt
+        )
+        .first()
+    )
+
+
+def book_slot(retries=3, **fields):
+    """Insert an appointment if its slot is free, atomically with the overlap check.
+
+    Raises SlotTaken when the slot is held. Lock conflicts are retried with
+    jittered backoff up to `retries` times before the error propagates.
+    """
+    # Under REPEATABLE READ the overlap check would otherwise read the snapshot
+    # opened by the caller's earlier queries and miss bookings committed since
+    db.session.rollback()
+    for attempt in range(retries + 1):
+        try:
+            lock_doctor(fields['doctor_id'])
+            if find_overlap(fields['doctor_id'], fields['start_time'], fields['end_time']):
+                db.session.rollback()
+                raise SlotTaken()
+            appointment = Appointment(**fields)
+            db.session.add(appointment)
+            db.session.flush()
+            appointment_id = appointment.id
+            bump_appointment_lists(fields['doctor_id'], fields['patient_id'])
+            db.session.commit()
+            return appointment_id
+        except OperationalError as e:
+            db.session.rollback()
+            if attempt == retries or not _is_lock_conflict(e):
+                raise
+            logger.warning("Booking lock conflict for doctor %s, retrying: %s", fields['doctor_id'], e.orig)
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
@@ -0,0 +1,165 @@
+from models import db, ChatMessage
+from log import get_logger
+from receipts import READER_FOR_SENDER
+from versions import bump_readers
+from id_blocks import IdAllocator
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, OperationalError
+from datetime import datetime
+import atexit
+import threading
+
+logger = get_logger('chat_writer')
+
+
+class ChatWriteBehind:
+    """Buffers chat messages and bulk-inserts them off the send path.
+
+    Messages get their id and sent_at at submit time so they can be broadcast
+    immediately. Ids come from an IdAllocator block reserved in the database, so
+    they stay unique across workers.
+
+    A batch the database rejects (IntegrityError, DataError, ...) is retried one
+    row per transaction and the rows that still fail are logged and dropped.
+    A transient OperationalError puts the batch back for up to `max_attempts`
+    flushes, after which it is dropped the same way, so one bad row or a long
+    outage cannot wedge the buffer. Once `max_pending` messages are buffered,
+    submit() flushes inline.
+
+    Durability: a crash loses at most `interval_ms` worth of messages (or
+    `batch_size` messages).
+    """
+
+    def __init__(self, app, interval_ms=200, batch_size=100, max_pending=5000, max_attempts=3, id_block_size=100):
+        self.app = app
+        self.ids = IdAllocator(app, ChatMessage, block_size=id_block_size)
+        self.interval = interval_ms / 1000.0
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._pending = []
+        self._failed_attempts = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='chat-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, appointment_id, sender_type, sender_id, message):
+        """Queue a message; returns the row as it will be stored"""
+        row = {
+            'id': self.ids.next_id(),
+            'appointment_id': appointment_id,
+            'sender_type': sender_type,
+            'sender_id': sender_id,
+            'message': message,
+            'sent_at': datetime.utcnow(),
+            'is_read': False
+        }
+        with self._lock:
+            self._pending.append(row)
+            pending = len(self._pending)
+
+        if pending >= self.max_pending:
+            self.flush()
+        elif pending >= self.batch_size:
+            self._wakeup.set()
+        return row
+
+    def flush(self):
+        """Write everything buffered so far; safe to call from any thread"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            with self.app.app_context():
+                try:
+                    self._insert(rows)
+                    self._failed_attempts = 0
+                    return len(rows)
+                except OperationalError as e:
+                    db.session.rollback()
+                    self._failed_attempts += 1
+                    if self._failed_attempts < self.max_attempts:
+                        logger.warning("Chat write-behind flush failed (attempt %d of %d), retrying: %s",
+                                       self._failed_attempts, self.max_attempts, e)
+                        with self._lock:
+                            self._pending = rows + self._pending
+                        return 0
+                    self._failed_attempts = 0
+                    self._drop(rows, e)
+                    return 0
+                except Exception as e:
+                    db.session.rollback()
+                    logger.warning("Chat write-behind batch of %d rejected, inserting row by row: %s", len(rows), e)
+                    return self._insert_each(rows)
+
+    def _insert(self, rows):
+        """Insert rows and bump the readers' list versions in one transaction"""
+        db.session.execute(insert(ChatMessage), rows)
+        for reader_type in ('doctor', 'patient'):
+            appointment_ids = {
+                row['appointment_id'] for row in rows if READER_FOR_SENDER.get(row['sender_type']) == reader_type
+            }
+            if appointment_ids:
+                bump_readers(appointment_ids, reader_type)
+        db.session.commit()
+
+    def _insert_each(self, rows):
+        """One transaction per row, so only the rows the database rejects are lost"""
+        inserted = 0
+        for index, row in enumerate(rows):
+            try:
+                self._insert_one(row)
+                inserted += 1
+            except OperationalError as e:
+                db.session.rollback()
+                logger.warning("Chat write-behind row-by-row insert interrupted, retrying later: %s", e)
+                with self._lock:
+                    self._pending = rows[index:] + self._pending
+                break
+            except Exception as e:
+                db.session.rollback()
+                self._drop([row], e)
+        return inserted
+
+    def _insert_one(self, row):
+        try:
+            self._insert([row])
+        except IntegrityError:
+            db.session.rollback()
+            if db.session.query(ChatMessage.id).filter_by(id=row['id']).first() is None:
+                raise
+            # An insert that bypassed the allocator took this id; keep the message
+            # under a new one (clients that saw the old id resync on rejoin)
+            logger.warning("Chat message id %s already taken, storing it under a new id", row['id'])
+            row['id'] = self.ids.next_id()
+            self._insert([row])
+
+    def _drop(self, rows, error):
+        # The log line is the dead letter: enough to replay the message by hand
+        for row in rows:
+            logger.error("Dropping chat message %s (appointment %s, %s %s, sent_at %s): %s | %r",
+                         row['id'], row['appointment_id'], row['sender_type'], row['sender_id'],
+                         row['sent_at'].isoformat(), error, row['message'])
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stop(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush()
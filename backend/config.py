@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 from datetime import timedelta
 
@@ -8,9 +9,111 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-fallback')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'mysql+pymysql://root:@localhost/smartcare')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Under eventlet/gevent many greenlets share this pool; a short timeout turns
+    # exhaustion into a fast error instead of a stalled event loop
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+    # SQLite's in-memory pools reject sizing arguments
+    if not SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        SQLALCHEMY_ENGINE_OPTIONS.update({
+            'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+            'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        })
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     
     # JWT Configuration
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', SECRET_KEY)  # Use the same secret key for JWT
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)  # Token expires in 24 hours
-    JWT_ALGORITHM = 'HS256'
\ No newline at end of file
+    JWT_ALGORITHM = 'HS256'
+
+    # Bookings lock the doctor's row; lock conflicts are retried this many times
+    BOOKING_MAX_RETRIES = int(os.getenv('BOOKING_MAX_RETRIES', 3))
+
+    # Keyset pagination for appointment lists, chat history and doctor search.
+    # Appointment lists, the admin queue and chat history stay unpaged for
+    # clients that send neither ?limit= nor a cursor
+    APPOINTMENTS_PAGE_SIZE = int(os.getenv('APPOINTMENTS_PAGE_SIZE', 50))
+    CHAT_PAGE_SIZE = int(os.getenv('CHAT_PAGE_SIZE', 50))
+    ADMIN_PAGE_SIZE = int(os.getenv('ADMIN_PAGE_SIZE', 50))
+    DOCTOR_SEARCH_PAGE_SIZE = int(os.getenv('DOCTOR_SEARCH_PAGE_SIZE', 20))
+    # Most doctors one bulk approve/decline request may touch
+    ADMIN_BULK_MAX = int(os.getenv('ADMIN_BULK_MAX', 1000))
+    # Most doctors one batch available-slots request may ask for
+    SLOTS_BATCH_MAX = int(os.getenv('SLOTS_BATCH_MAX', 100))
+    # Admin patient import: body cap, rows per transaction, its own hashing pool
+    IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_BYTES', 200 * 1024 * 1024))
+    IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 500))
+    IMPORT_HASH_WORKERS = int(os.getenv('IMPORT_HASH_WORKERS', 2))
+    IMPORT_MAX_ERRORS = int(os.getenv('IMPORT_MAX_ERRORS', 1000))
+    # join-session with since_id/since_ts sends at most this many missed messages;
+    # a bigger gap gets a fresh CHAT_PAGE_SIZE tail instead
+    CHAT_SYNC_MAX_DELTA = int(os.getenv('CHAT_SYNC_MAX_DELTA', 200))
+    MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 200))
+
+    # Identity resolution: role/profile ids ride in the JWT, status checks are cached
+    IDENTITY_CACHE_TTL = int(os.getenv('IDENTITY_CACHE_TTL', 30))  # seconds
+    IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', 4096))
+
+    # Chat persistence: 'sync' commits each message before broadcasting,
+    # 'write_behind' broadcasts first and bulk-inserts every interval/batch, with
+    # ids reserved from the database CHAT_ID_BLOCK_SIZE at a time
+    CHAT_WRITE_MODE = os.getenv('CHAT_WRITE_MODE', 'sync')
+    CHAT_FLUSH_INTERVAL_MS = int(os.getenv('CHAT_FLUSH_INTERVAL_MS', 200))
+    CHAT_FLUSH_BATCH_SIZE = int(os.getenv('CHAT_FLUSH_BATCH_SIZE', 100))
+    CHAT_MAX_PENDING = int(os.getenv('CHAT_MAX_PENDING', 5000))
+    CHAT_ID_BLOCK_SIZE = int(os.getenv('CHAT_ID_BLOCK_SIZE', 100))
+
+    # appointment_id -> (session room, chat_active) cache used by socket events;
+    # evictions are per process, so the shorter TTL applies with SOCKETIO_MESSAGE_QUEUE
+    CHAT_ROOM_CACHE_TTL = int(os.getenv('CHAT_ROOM_CACHE_TTL', 900))  # seconds
+    CHAT_ROOM_CACHE_SHARED_TTL = int(os.getenv('CHAT_ROOM_CACHE_SHARED_TTL', 30))  # seconds
+
+    # Server runtime: 'threading' (one OS thread per socket; development) or
+    # 'gevent'/'eventlet' (cooperative; start with serve.py so the stdlib is patched
+    # first). Prefer gevent: eventlet is in maintenance mode.
+    SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')
+
+    # Running several Socket.IO workers: emits fan out through a message queue
+    # (redis://, amqp://, kafka://, or local:// for an in-process stand-in) and
+    # socket ownership lives in a shared presence registry (redis://; empty = per-process)
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE') or None
+    SOCKETIO_CHANNEL = os.getenv('SOCKETIO_CHANNEL', 'smartcare')
+    PRESENCE_REGISTRY_URL = os.getenv('PRESENCE_REGISTRY_URL') or None
+    # Doctors' is_online/last_seen are written in one batch per interval; a doctor
+    # not seen for PRESENCE_TIMEOUT seconds counts as offline, and a Redis registry
+    # entry not refreshed for that long expires
+    PRESENCE_FLUSH_INTERVAL = int(os.getenv('PRESENCE_FLUSH_INTERVAL', 15))  # seconds
+    PRESENCE_TIMEOUT = int(os.getenv('PRESENCE_TIMEOUT', 60))  # seconds
+    # Doctor lists report last_seen rounded down to this, so their ETag survives heartbeats
+    PRESENCE_LAST_SEEN_BUCKET = int(os.getenv('PRESENCE_LAST_SEEN_BUCKET', 300))  # seconds
+    # Per-process caches only see their own invalidations, so bound how stale they can get
+    DIRECTORY_CACHE_TTL = int(os.getenv('DIRECTORY_CACHE_TTL', 0))  # seconds, 0 = until invalidated
+    AVAILABILITY_CACHE_TTL = int(os.getenv('AVAILABILITY_CACHE_TTL', 300))  # seconds, 0 = until invalidated
+
+    # Password hashing runs on a bounded worker pool; logins past the queue limit get a 503
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 4))
+    PASSWORD_HASH_MAX_QUEUE = int(os.getenv('PASSWORD_HASH_MAX_QUEUE', 32))
+    PASSWORD_HASH_TIMEOUT = int(os.getenv('PASSWORD_HASH_TIMEOUT', 10))  # seconds
+
+    # Logging: JSON lines written by a background queue listener
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_REQUEST_SAMPLE_RATE = float(os.getenv('LOG_REQUEST_SAMPLE_RATE', 1.0))
+    # Per-route overrides, longest path prefix wins, e.g. {"/api/auth/patient/doctors": 0.05}
+    LOG_SAMPLE_RATES = json.loads(os.getenv('LOG_SAMPLE_RATES', '{}'))
+    SOCKETIO_LOGGING = os.getenv('SOCKETIO_LOGGING', 'false').lower() == 'true'
+
+    # Uploads are streamed to disk and stored by content hash; caps apply per file type
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 25 * 1024 * 1024))
+    UPLOAD_MAX_PHOTO_BYTES = int(os.getenv('UPLOAD_MAX_PHOTO_BYTES', 5 * 1024 * 1024))
+    UPLOAD_MAX_DOCUMENT_BYTES = int(os.getenv('UPLOAD_MAX_DOCUMENT_BYTES', 10 * 1024 * 1024))
+
+    # Serving uploads: cache lifetimes and optional proxy offload
+    # ('x-sendfile' for Apache/lighttpd, 'x-accel-redirect' for nginx)
+    UPLOAD_IMMUTABLE_MAX_AGE = int(os.getenv('UPLOAD_IMMUTABLE_MAX_AGE', 365 * 24 * 3600))
+    UPLOAD_CACHE_MAX_AGE = int(os.getenv('UPLOAD_CACHE_MAX_AGE', 3600))
+    UPLOAD_SENDFILE_MODE = os.getenv('UPLOAD_SENDFILE_MODE') or None
+    UPLOAD_ACCEL_PREFIX = os.getenv('UPLOAD_ACCEL_PREFIX', '/protected-uploads/')
@@ -0,0 +1,177 @@
+from flask import current_app
+from models import db, User, Doctor
+from availability import WEEKDAYS, get_availability, format_availability, available_at
+from pagination import keyset_page
+from serializers import doctor_listing
+from fastjson import dumps
+from sqlalchemy import func
+import hashlib
+import threading
+import time
+
+# Process-level cache of the serialized approved-doctor list served by /patient/doctors.
+# Every write that changes what the list shows must call invalidate_directory().
+# With several workers an invalidation only reaches its own process, so
+# DIRECTORY_CACHE_TTL also expires the list after a fixed age.
+_lock = threading.Lock()
+_doctors = None
+_etag = None
+_built_at = 0.0
+_generation = 0
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def _build_directory():
+    """Serialize every approved, active doctor with a single joined query"""
+    rows = (
+        db.session.query(Doctor, User.is_active)
+        .join(User, Doctor.user_id == User.id)
+        .filter(Doctor.is_approved == True, User.is_active == True)
+        .order_by(Doctor.id)
+        .all()
+    )
+    availability = get_availability([doctor.id for doctor, _ in rows])
+    return [doctor_listing(doctor, is_active, format_availability(availability[doctor.id])) for doctor, is_active in rows]
+
+
+# ?sort= value -> (sort expression, reads the sort value off a Doctor)
+SEARCH_SORTS = {
+    'name': (Doctor.name, lambda doctor: doctor.name),
+    'price': (func.coalesce(Doctor.pricing, 0.0), lambda doctor: doctor.pricing or 0.0),
+    'newest': (Doctor.created_at, lambda doctor: doctor.created_at),
+}
+
+
+def _flag(value):
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError("instant_available must be true or false")
+
+
+def _minute_of_day(value):
+    hours, minutes = value.split(':')
+    minute = int(hours) * 60 + int(minutes)
+    if not 0 <= minute < 24 * 60:
+        raise ValueError
+    return minute
+
+
+def search_doctors(args, limit, cursor=None):
+    """One page of approved, active doctors matching the query-string filters.
+
+    Filters: specialization (exact), name (prefix), instant_available,
+    min_price/max_price, and available_day (+ optional available_at "HH:MM").
+    Sorted by ?sort=name|price|newest and ?order=asc|desc, then id.
+    Returns (serialized doctors, next_cursor); raises ValueError on bad input.
+    """
+    query = (
+        Doctor.query
+        .join(User, Doctor.user_id == User.id)
+        .filter(Doctor.is_approved == True, User.is_active == True)
+    )
+
+    specialization = (args.get('specialization') or '').strip()
+    if specialization:
+        query = query.filter(Doctor.specialization == specialization)
+
+    name = (args.get('name') or '').strip()
+    if name:
+        escaped = name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.filter(Doctor.name.like(escaped + '%', escape='\\'))
+
+    if args.get('instant_available'):
+        query = query.filter(Doctor.instant_available == _flag(args['instant_available']))
+
+    try:
+        min_price = float(args['min_price']) if args.get('min_price') else None
+        max_price = float(args['max_price']) if args.get('max_price') else None
+    except ValueError:
+        raise ValueError("Invalid price range")
+    if min_price is not None:
+        query = query.filter(Doctor.pricing >= min_price)
+    if max_price is not None:
+        query = query.filter(Doctor.pricing <= max_price)
+
+    day = args.get('available_day')
+    if day:
+        if day not in WEEKDAYS:
+            raise ValueError("available_day must be a weekday name")
+        minute = None
+        if args.get('available_at'):
+            try:
+                minute = _minute_of_day(args['available_at'])
+            except ValueError:
+                raise ValueError("available_at must be HH:MM")
+        query = query.filter(Doctor.id.in_(available_at(WEEKDAYS.index(day), minute)))
+
+    sort = args.get('sort') or 'name'
+    if sort not in SEARCH_SORTS:
+        raise ValueError(f"sort must be one of: {', '.join(SEARCH_SORTS)}")
+    order = args.get('order') or ('desc' if sort == 'newest' else 'asc')
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be asc or desc")
+    sort_column, sort_value = SEARCH_SORTS[sort]
+
+    doctors, next_cursor = keyset_page(
+        query,
+        sort_column,
+        Doctor.id,
+        cursor=cursor,
+        limit=limit,
+        descending=order == 'desc',
+        key=lambda doctor: (sort_value(doctor), doctor.id)
+    )
+    availability = get_availability([doctor.id for doctor in doctors])
+    return [
+        {**doctor_listing(doctor, True, format_availability(availability[doctor.id])), "pricing": doctor.pricing or 0.0}
+        for doctor in doctors
+    ], next_cursor
+
+
+def directory_state():
+    """(doctor list, etag); rebuilt on the first call after an invalidation.
+
+    The etag is a digest of the list taken once per rebuild, so workers with
+    the same list agree on it and revalidating costs no serialization.
+    """
+    global _doctors, _etag, _built_at
+    ttl = current_app.config.get('DIRECTORY_CACHE_TTL')
+    with _lock:
+        if _doctors is not None and ttl and time.monotonic() - _built_at > ttl:
+            _doctors = None
+        if _doctors is not None:
+            _stats["hits"] += 1
+            return _doctors, _etag
+        _stats["misses"] += 1
+        generation = _generation
+
+    doctors = _build_directory()
+    etag = hashlib.blake2b(dumps(doctors).encode('utf-8'), digest_size=8).hexdigest()
+
+    with _lock:
+        # An invalidation that raced with the rebuild wins; the next call rebuilds again
+        if generation == _generation:
+            _doctors, _etag = doctors, etag
+            _built_at = time.monotonic()
+    return doctors, etag
+
+
+def invalidate_directory():
+    global _doctors, _generation
+    with _lock:
+        _doctors = None
+        _generation += 1
+        _stats["invalidations"] += 1
+
+
+def directory_stats():
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+            "cached": _doctors is not None,
+            "size": len(_doctors) if _doctors is not None else 0,
+        }
@@ -0,0 +1,80 @@
+"""JSON encoding for Flask responses and Socket.IO packets.
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise. Both paths emit datetimes/dates as ISO 8601 strings (the same text
+as .isoformat()), so serializers can hand datetimes over unconverted.
+"""
+from flask.json.provider import DefaultJSONProvider
+from datetime import date
+from decimal import Decimal
+import json
+
+try:
+    import orjson
+except ImportError:  # optional speedup; the stdlib encoder produces the same output
+    orjson = None
+
+# Like json.dumps, allow int keys such as {doctor_id: ...}
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+def _default(obj):
+    """Types neither encoder handles natively"""
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj, **kwargs):
+    """Compact JSON text; keyword arguments for json.dumps are accepted and ignored under orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode('utf-8')
+    kwargs.setdefault('default', _default)
+    kwargs.setdefault('separators', (',', ':'))
+    return json.dumps(obj, **kwargs)
+
+
+def loads(s, **kwargs):
+    if orjson is not None:
+        return orjson.loads(s)
+    return json.loads(s, **kwargs)
+
+
+class SocketIOJSON:
+    """The module-like object Socket.IO takes as its `json` option"""
+    dumps = staticmethod(dumps)
+    loads = staticmethod(loads)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson.
+
+    Keys keep insertion order instead of being sorted, and output is always
+    compact. Falls back to DefaultJSONProvider when orjson is missing.
+    """
+    sort_keys = False
+    compact = True
+
+    default = staticmethod(_default)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        # Skip the bytes -> str -> bytes round trip of dumps()
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
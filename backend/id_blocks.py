@@ -0,0 +1,58 @@
+"""Ids handed out before the row is inserted.
+
+Write-behind chat broadcasts a message with its id before the batch holding it
+is written. Each process reserves a block of ids at a time with one UPDATE on
+the table's id_blocks row, which the database serializes, so workers never hand
+out the same id. A block always starts above the table's current MAX(id), which
+covers rows inserted with autoincrement ids before the reservation. A row
+inserted that way while a block is outstanding can still take one of its ids;
+callers must handle that IntegrityError (ChatWriteBehind stores the message
+under a fresh id).
+"""
+from models import db, IdBlock
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+import threading
+
+
+class IdAllocator:
+    """Hands out primary keys for `model` from per-process blocks of `block_size`"""
+
+    def __init__(self, app, model, block_size=100):
+        self.app = app
+        self.model = model
+        self.name = model.__tablename__
+        self.block_size = block_size
+        self._next = self._end = 0
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            if self._next >= self._end:
+                self._end = self._reserve()
+                self._next = self._end - self.block_size
+            allocated = self._next
+            self._next += 1
+            return allocated
+
+    def _reserve(self):
+        """Move the shared counter past one block; returns the block's exclusive end"""
+        with self.app.app_context():
+            floor = select(func.coalesce(func.max(self.model.id), 0) + 1).scalar_subquery()
+            while True:
+                # Own connection and transaction: commits independently of the caller's session
+                with db.engine.begin() as conn:
+                    reserved = conn.execute(
+                        update(IdBlock)
+                        .where(IdBlock.name == self.name)
+                        .values(next_id=case((IdBlock.next_id > floor, IdBlock.next_id), else_=floor) + self.block_size)
+                    ).rowcount
+                    if reserved:
+                        return conn.execute(select(IdBlock.next_id).where(IdBlock.name == self.name)).scalar()
+                try:
+                    with db.engine.begin() as conn:
+                        conn.execute(insert(IdBlock).values(name=self.name, next_id=floor + self.block_size))
+                        return conn.execute(select(IdBlock.next_id).where(IdBlock.name == self.name)).scalar()
+                except IntegrityError:
+                    # Another worker created the row first; reserve through it
+                    continue
@@ -0,0 +1,103 @@
+from flask import jsonify, current_app
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from models import db, User, Doctor, Patient
+from collections import OrderedDict, namedtuple
+import threading
+import time
+
+Identity = namedtuple('Identity', ['user_id', 'role', 'doctor_id', 'patient_id'])
+
+# user_id -> (is_active, is_approved, expires_at); small LRU so blocked users drop out within the TTL
+_status_lock = threading.Lock()
+_status_cache = OrderedDict()
+
+
+def identity_claims(user, doctor=None, patient=None):
+    """Claims embedded in the access token at login so handlers don't re-query the profile"""
+    return {
+        "role": user.role,
+        "doctor_id": doctor.id if doctor else None,
+        "patient_id": patient.id if patient else None,
+    }
+
+
+def identity_from_claims(user_id, claims):
+    """Build an Identity from token claims, falling back to the DB for tokens issued before claims existed"""
+    if claims.get('role'):
+        return Identity(user_id, claims['role'], claims.get('doctor_id'), claims.get('patient_id'))
+
+    user = User.query.get(user_id)
+    if not user:
+        return None
+    doctor_id = patient_id = None
+    if user.role == 'doctor':
+        doctor = Doctor.query.filter_by(user_id=user_id).first()
+        doctor_id = doctor.id if doctor else None
+    elif user.role == 'patient':
+        patient = Patient.query.filter_by(user_id=user_id).first()
+        patient_id = patient.id if patient else None
+    return Identity(user_id, user.role, doctor_id, patient_id)
+
+
+def user_status(user_id):
+    """(is_active, is_approved, is_blocked) for a user, served from the TTL/LRU cache when fresh"""
+    now = time.monotonic()
+    with _status_lock:
+        entry = _status_cache.get(user_id)
+        if entry and entry[3] > now:
+            _status_cache.move_to_end(user_id)
+            return entry[:3]
+
+    row = (
+        db.session.query(User.is_active, Doctor.is_approved, User.is_blocked)
+        .outerjoin(Doctor, Doctor.user_id == User.id)
+        .filter(User.id == user_id)
+        .first()
+    )
+    if not row:
+        return None
+    is_active, is_approved, is_blocked = bool(row[0]), bool(row[1]), bool(row[2])
+
+    with _status_lock:
+        _status_cache[user_id] = (is_active, is_approved, is_blocked, now + current_app.config['IDENTITY_CACHE_TTL'])
+        _status_cache.move_to_end(user_id)
+        while len(_status_cache) > current_app.config['IDENTITY_CACHE_SIZE']:
+            _status_cache.popitem(last=False)
+    return is_active, is_approved, is_blocked
+
+
+def invalidate_user_status(user_id):
+    """Call after changing a user's is_active/is_blocked or their doctor's is_approved"""
+    with _status_lock:
+        _status_cache.pop(user_id, None)
+
+
+def resolve_identity(role):
+    """Resolve the caller of a @jwt_required() handler.
+
+    Returns (identity, None) on success or (None, error_response) with the same
+    messages handlers used to build by hand.
+    """
+    try:
+        user_id = int(get_jwt_identity())
+    except (ValueError, TypeError):
+        return None, (jsonify({"error": "Invalid token"}), 401)
+
+    identity = identity_from_claims(user_id, get_jwt())
+    if not identity or identity.role != role:
+        return None, (jsonify({"error": f"{role.capitalize()} access required"}), 403)
+    if role == 'doctor' and not identity.doctor_id:
+        return None, (jsonify({"error": "Doctor not found"}), 404)
+    if role == 'patient' and not identity.patient_id:
+        return None, (jsonify({"error": "Patient not found"}), 404)
+
+    status = user_status(user_id)
+    if not status:
+        return None, (jsonify({"error": "User not found"}), 404)
+    is_active, is_approved, is_blocked = status
+    # For doctors is_active is the self-service availability switch (toggle_active), not a block
+    if is_blocked or (role != 'doctor' and not is_active):
+        return None, (jsonify({"error": "Account is blocked"}), 403)
+    if role == 'doctor' and not is_approved:
+        return None, (jsonify({"error": "Doctor account not approved by admin"}), 403)
+    return identity, None
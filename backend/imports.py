@@ -0,0 +1,184 @@
+"""Bulk patient onboarding from a CSV or NDJSON stream.
+
+Rows are read one at a time from the request body and processed in batches:
+validate, hash the batch's passwords in parallel, then insert the users and
+their patient profiles in one transaction per batch. Every rejected row is
+reported with its 1-based row number.
+
+Columns/keys: email, password (or password_hash, an existing bcrypt hash),
+name, age, gender, medical_history.
+"""
+from models import db, User, Patient
+from passwords import hash_many, MAX_PASSWORD_BYTES
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+import csv
+import io
+import json
+import re
+
+FORMATS = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+BCRYPT_HASH = re.compile(r'^\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}$')
+
+
+def read_rows(stream, fmt):
+    """Yield (row_number, dict or None, error) from a byte stream without buffering it"""
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='' if fmt == 'csv' else None)
+    if fmt == 'csv':
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            yield number, row, None
+        return
+    number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError
+            yield number, row, None
+        except ValueError:
+            yield number, None, "Invalid JSON object"
+
+
+def _text(row, field):
+    """A field that must be a string when present; None when missing or empty"""
+    value = row.get(field)
+    if value is None or value == '':
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be a string")
+    return value
+
+
+def _validate(row):
+    """Normalized row, or raises ValueError with the reason"""
+    email = (_text(row, 'email') or '').strip()
+    name = (_text(row, 'name') or '').strip()
+    password = _text(row, 'password')
+    password_hash = _text(row, 'password_hash')
+    if not email or '@' not in email:
+        raise ValueError("Missing or invalid email")
+    if not name:
+        raise ValueError("Missing name")
+    if not password and not password_hash:
+        raise ValueError("Missing password")
+    if password_hash and not BCRYPT_HASH.match(password_hash):
+        raise ValueError("password_hash is not a bcrypt hash")
+    if not password_hash and len(password.encode('utf-8')) > MAX_PASSWORD_BYTES:
+        raise ValueError(f"Password is longer than {MAX_PASSWORD_BYTES} bytes")
+    try:
+        age = int(row.get('age'))
+    except (TypeError, ValueError):
+        raise ValueError("Missing or invalid age")
+    return {
+        'email': email,
+        'password': None if password_hash else password,
+        'password_hash': password_hash,
+        'name': name,
+        'age': age,
+        'gender': _text(row, 'gender'),
+        'medical_history': _text(row, 'medical_history'),
+    }
+
+
+class PatientImport:
+    """Accumulates rows and writes them in batches; see report() for the outcome"""
+
+    def __init__(self, batch_size=500, max_errors=1000):
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self._batch = []
+        self._seen = set()
+
+    def _fail(self, number, email, error):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': number, 'email': email, 'error': error})
+
+    def add(self, number, row, error=None):
+        if error is None:
+            try:
+                row = _validate(row)
+            except ValueError as e:
+                error = str(e)
+        if error:
+            self._fail(number, (row or {}).get('email'), error)
+            return
+        if row['email'] in self._seen:
+            self._fail(number, row['email'], "Duplicate email in import")
+            return
+        self._seen.add(row['email'])
+        self._batch.append((number, row))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        emails = [row['email'] for _, row in batch]
+        existing = {email for (email,) in db.session.query(User.email).filter(User.email.in_(emails))}
+        fresh = []
+        for number, row in batch:
+            if row['email'] in existing:
+                self._fail(number, row['email'], "Email already exists")
+            else:
+                fresh.append((number, row))
+        batch = fresh
+        if not batch:
+            return
+
+        to_hash = [row['password'] for _, row in batch if row['password'] is not None]
+        hashes = iter(hash_many(to_hash))
+        for _, row in batch:
+            row['password_hash'] = row['password_hash'] or next(hashes)
+
+        try:
+            self._insert([row for _, row in batch])
+            self.imported += len(batch)
+        except IntegrityError:
+            # Someone signed up with one of these emails meanwhile; settle it row by row
+            db.session.rollback()
+            for number, row in batch:
+                try:
+                    self._insert([row])
+                    self.imported += 1
+                except IntegrityError:
+                    db.session.rollback()
+                    self._fail(number, row['email'], "Email already exists")
+
+    def _insert(self, rows):
+        """Users then profiles, one executemany each, committed together"""
+        db.session.execute(insert(User), [
+            {'email': row['email'], 'password': row['password_hash'], 'role': 'patient', 'is_active': True}
+            for row in rows
+        ])
+        user_ids = dict(
+            db.session.query(User.email, User.id).filter(User.email.in_([row['email'] for row in rows]))
+        )
+        db.session.execute(insert(Patient), [
+            {
+                'user_id': user_ids[row['email']], 'name': row['name'], 'age': row['age'],
+                'gender': row['gender'], 'medical_history': row['medical_history']
+            }
+            for row in rows
+        ])
+        db.session.commit()
+
+    def report(self):
+        return {
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
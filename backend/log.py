@@ -0,0 +1,72 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from datetime import datetime, timezone
+
+ROOT_LOGGER = 'smartcare'
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+_sample_rates = {}
+_default_sample_rate = 1.0
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra={...}` fields become top-level keys"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def get_logger(name):
+    """Child of the app logger, e.g. get_logger('routes') -> 'smartcare.routes'"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def configure_logging(app):
+    """Route all app logging through a queue so request threads never block on stdout"""
+    global _listener, _sample_rates, _default_sample_rate
+    if _listener:
+        return
+
+    level = getattr(logging, str(app.config.get('LOG_LEVEL', 'INFO')).upper(), logging.INFO)
+    _sample_rates = app.config.get('LOG_SAMPLE_RATES') or {}
+    _default_sample_rate = app.config.get('LOG_REQUEST_SAMPLE_RATE', 1.0)
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(JsonFormatter())
+    log_queue = queue.Queue(-1)
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.propagate = False
+
+
+def sample_request(path):
+    """Per-route sampling for routine request logs; the longest matching path prefix wins"""
+    rate = _default_sample_rate
+    match = ''
+    for prefix, prefix_rate in _sample_rates.items():
+        if path.startswith(prefix) and len(prefix) > len(match):
+            match, rate = prefix, prefix_rate
+    return rate >= 1.0 or random.random() < rate
@@ -0,0 +1,189 @@
+from sqlalchemy import func, inspect, text
+from sqlalchemy.schema import CreateColumn
+from models import db, Doctor, DoctorAvailability, Appointment, ChatMessage
+from availability import set_availability, available_at
+from log import get_logger
+from booking import BLOCKING_STATUSES
+from datetime import datetime, timedelta
+
+logger = get_logger('migrations')
+
+
+def ensure_columns():
+    """Add model-declared columns missing from existing tables.
+
+    Like ensure_indexes, for databases created before a column was added to
+    models.py. New columns need a server_default (or must be nullable) so
+    existing rows get a value. Safe to run on every startup.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+            with db.engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+# Indexes models.py no longer declares because a composite index covers them;
+# dropped so writes stop maintaining them
+OBSOLETE_INDEXES = {
+    'doctors': ('ix_doctors_is_approved',),  # now ix_doctors_approved_created
+}
+
+
+def ensure_indexes():
+    """Create any model-declared index missing from an existing database.
+
+    db.create_all() only creates missing tables, so databases created before an
+    index was added to models.py need this pass; OBSOLETE_INDEXES still present
+    are dropped. Safe to run on every startup.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=db.engine)
+                created.append(index.name)
+        for name in OBSOLETE_INDEXES.get(table.name, ()):
+            if name in existing:
+                # MySQL scopes index names to their table
+                on_table = f" ON {table.name}" if db.engine.dialect.name == 'mysql' else ''
+                with db.engine.begin() as conn:
+                    conn.execute(text(f"DROP INDEX {name}{on_table}"))
+                logger.info("Dropped obsolete index %s", name)
+    return created
+
+
+def backfill_availability():
+    """Build doctor_availability rows for doctors that only have the legacy JSON column.
+
+    Doctors with unparseable JSON are logged and left without rows. Safe to run
+    on every startup; returns how many doctors were converted.
+    """
+    has_rows = db.session.query(DoctorAvailability.doctor_id).distinct()
+    doctors = (
+        Doctor.query
+        .filter(Doctor.availability.isnot(None), Doctor.availability != '', Doctor.id.notin_(has_rows))
+        .all()
+    )
+    converted = 0
+    for doctor in doctors:
+        try:
+            if set_availability(doctor, doctor.availability):
+                converted += 1
+        except ValueError as e:
+            logger.warning("Skipping availability backfill for doctor %s: %s", doctor.id, e)
+    db.session.commit()
+    return converted
+
+
+def hot_queries():
+    """The query shapes the indexes exist for, as (name, statement) pairs"""
+    now = datetime.utcnow()
+    overlap = Appointment.query.filter(
+        Appointment.doctor_id == 1,
+        Appointment.status.in_(BLOCKING_STATUSES),
+        Appointment.start_time < now + timedelta(minutes=25),
+        Appointment.end_time > now
+    ).limit(1)
+    schedule = Appointment.query.filter(
+        Appointment.doctor_id == 1,
+        Appointment.status == 'accepted',
+        Appointment.start_time >= now,
+        Appointment.start_time <= now + timedelta(days=14)
+    )
+    chat_history = ChatMessage.query.filter_by(appointment_id=1).order_by(ChatMessage.sent_at)
+    chat_unread = (
+        db.session.query(ChatMessage.appointment_id, func.count())
+        .filter(
+            ChatMessage.appointment_id.in_([1, 2, 3]),
+            ChatMessage.is_read == False,
+            ChatMessage.sender_type == 'doctor'
+        )
+        .group_by(ChatMessage.appointment_id)
+    )
+    available_at_time = Doctor.query.filter(
+        Doctor.is_approved == True,
+        Doctor.id.in_(available_at(now.weekday(), 10 * 60))
+    )
+    doctor_search = (
+        Doctor.query
+        .filter(Doctor.is_approved == True, Doctor.specialization == 'Cardiology', Doctor.pricing <= 100)
+        .order_by(Doctor.pricing, Doctor.id)
+        .limit(20)
+    )
+    return [
+        ('booking_overlap', overlap.statement),
+        ('doctor_schedule', schedule.statement),
+        ('chat_history', chat_history.statement),
+        ('chat_unread', chat_unread.statement),
+        ('doctors_available_at', available_at_time.statement),
+        ('doctor_search', doctor_search.statement),
+    ]
+
+
+def explain(statement):
+    """Run EXPLAIN (QUERY PLAN on SQLite) and return (plan_rows, full_scan)"""
+    engine = db.engine
+    compiled = statement.compile(dialect=engine.dialect, compile_kwargs={"render_postcompile": True})
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+        details = [row[-1] for row in rows]
+        full_scan = any(d.startswith('SCAN') and 'USING' not in d for d in details)
+        return details, full_scan
+
+    with engine.connect() as conn:
+        result = conn.exec_driver_sql(f"EXPLAIN {compiled}", params)
+        rows = [dict(row._mapping) for row in result]
+    full_scan = any(row.get('type') == 'ALL' for row in rows)
+    return rows, full_scan
+
+
+def check_query_plans():
+    """EXPLAIN every hot query; returns {name: {"plan": ..., "full_scan": bool}}"""
+    report = {}
+    for name, statement in hot_queries():
+        plan, full_scan = explain(statement)
+        report[name] = {"plan": plan, "full_scan": full_scan}
+    return report
+
+
+if __name__ == '__main__':
+    import sys
+    from app import app
+
+    with app.app_context():
+        added = ensure_columns()
+        print(f"Columns added: {added or 'none'}")
+        created = ensure_indexes()
+        print(f"Indexes created: {created or 'none'}")
+
+        if '--explain' in sys.argv:
+            failed = False
+            for name, result in check_query_plans().items():
+                status = "FULL SCAN" if result["full_scan"] else "ok"
+                print(f"{name}: {status}")
+                for line in result["plan"]:
+                    print(f"    {line}")
+                failed = failed or result["full_scan"]
+            sys.exit(1 if failed else 0)
@@ -11,6 +11,9 @@ class User(db.Model):
     password = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), nullable=False)
     is_active = db.Column(db.Boolean, default=True)
+    # Set when an admin declines the account; for doctors is_active is their own
+    # availability switch, so it cannot double as a block
+    is_blocked = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     patient = db.relationship('Patient', backref='user', uselist=False)
@@ -19,17 +22,29 @@ class User(db.Model):
 class Patient(db.Model):
     __tablename__ = 'patients'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     name = db.Column(db.String(100), nullable=False)
     age = db.Column(db.Integer, nullable=False)
     gender = db.Column(db.String(20), nullable=True)
     medical_history = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # ETag stamps, see versions.py
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    appointments_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
 class Doctor(db.Model):
     __tablename__ = 'doctors'
+    __table_args__ = (
+        # directory filter and the admin pending queue (oldest first)
+        db.Index('ix_doctors_approved_created', 'is_approved', 'created_at'),
+        # doctor search: specialization filter with a price range or price sort
+        db.Index('ix_doctors_approved_specialization_price', 'is_approved', 'specialization', 'pricing'),
+        # doctor search: name prefix and name sort
+        db.Index('ix_doctors_approved_name', 'is_approved', 'name'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     name = db.Column(db.String(100), nullable=False)
     specialization = db.Column(db.String(100), nullable=False)
     documents = db.Column(db.Text, nullable=True)
@@ -44,8 +59,30 @@ class Doctor(db.Model):
     is_online = db.Column(db.Boolean, default=False)
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # ETag stamps, see versions.py
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    appointments_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+class DoctorAvailability(db.Model):
+    __tablename__ = 'doctor_availability'
+    __table_args__ = (
+        # "who works on this weekday at this time" lookups
+        db.Index('ix_doctor_availability_day_start', 'weekday', 'start_minute', 'end_minute'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False, index=True)
+    weekday = db.Column(db.SmallInteger, nullable=False)  # 0 = Monday
+    start_minute = db.Column(db.SmallInteger, nullable=False)  # minutes after midnight
+    end_minute = db.Column(db.SmallInteger, nullable=False)
+
 class Appointment(db.Model):
     __tablename__ = 'appointments'
+    __table_args__ = (
+        # booking overlap check, doctor schedule and slot window lookups
+        db.Index('ix_appointments_doctor_status_start', 'doctor_id', 'status', 'start_time'),
+        # patient appointment list
+        db.Index('ix_appointments_patient_start', 'patient_id', 'start_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
@@ -72,10 +109,21 @@ class Prescription(db.Model):
 
 class ChatMessage(db.Model):
     __tablename__ = 'chat_messages'
+    __table_args__ = (
+        # chat history ordered by sent_at
+        db.Index('ix_chat_messages_appointment_sent', 'appointment_id', 'sent_at'),
+        # unread counts and mark-read receipts
+        db.Index('ix_chat_messages_unread', 'appointment_id', 'is_read', 'sender_type'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False)
     sender_type = db.Column(db.String(10), nullable=False)  
     sender_id = db.Column(db.Integer, nullable=False)       
     message = db.Column(db.Text, nullable=False)
     sent_at = db.Column(db.DateTime, default=datetime.utcnow)
-    is_read = db.Column(db.Boolean, default=False)
\ No newline at end of file
+    is_read = db.Column(db.Boolean, default=False)
+class IdBlock(db.Model):
+    """Next unreserved id per table for ids handed out before insert; see id_blocks.py"""
+    __tablename__ = 'id_blocks'
+    name = db.Column(db.String(64), primary_key=True)
+    next_id = db.Column(db.BigInteger, nullable=False)
@@ -0,0 +1,90 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from log import get_logger
+from collections import OrderedDict
+import threading
+
+logger = get_logger('notifications')
+
+_SESSION_KEY = 'pending_notifications'
+
+# Set by init_notifications
+dispatcher = None
+
+
+class NotificationDispatcher:
+    """Emits Socket.IO notifications from a background task instead of the request.
+
+    Events are keyed by (room, event, key). An event still waiting when a newer
+    one with the same key arrives is replaced by it, so a recipient never gets
+    two stale copies of the same update.
+    """
+
+    def __init__(self, socketio, max_pending=10000):
+        self.socketio = socketio
+        self.max_pending = max_pending
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def start(self):
+        # start_background_task picks a thread or greenlet to match the async mode
+        self.socketio.start_background_task(self._run)
+
+    def enqueue(self, room, event_name, payload, key=None):
+        dedup_key = (room, event_name, key)
+        with self._lock:
+            self._pending.pop(dedup_key, None)
+            if len(self._pending) >= self.max_pending:
+                dropped, _ = self._pending.popitem(last=False)
+                logger.warning("Notification queue full, dropped %s for %s", dropped[1], dropped[0])
+            self._pending[dedup_key] = payload
+        self._wakeup.set()
+
+    def drain(self):
+        """Emit everything queued so far; returns how many events went out"""
+        with self._lock:
+            batch, self._pending = self._pending, OrderedDict()
+        for (room, event_name, _), payload in batch.items():
+            try:
+                self.socketio.emit(event_name, payload, to=room)
+            except Exception as e:
+                logger.error("Failed to emit %s to %s: %s", event_name, room, e)
+        return len(batch)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self.drain()
+
+
+def notify(session, room, event_name, payload, key=None):
+    """Queue an emit that goes out only if `session` commits"""
+    session.info.setdefault(_SESSION_KEY, []).append((room, event_name, payload, key))
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_after_commit(session):
+    pending = session.info.pop(_SESSION_KEY, None)
+    if not pending:
+        return
+    if dispatcher is None:
+        logger.warning("Notification dispatcher not started; dropped %d events", len(pending))
+        return
+    for room, event_name, payload, key in pending:
+        dispatcher.enqueue(room, event_name, payload, key)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_after_rollback(session, previous_transaction):
+    # A savepoint rolling back leaves the outer transaction's events in place
+    if not previous_transaction.nested:
+        session.info.pop(_SESSION_KEY, None)
+
+
+def init_notifications(socketio):
+    global dispatcher
+    dispatcher = NotificationDispatcher(socketio)
+    dispatcher.start()
+    return dispatcher
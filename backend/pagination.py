@@ -0,0 +1,84 @@
+from sqlalchemy import and_, or_
+from datetime import datetime
+import base64
+import json
+
+
+def encode_cursor(sort_value, row_id):
+    """Opaque cursor for the last row of a page; sort_value is a datetime, str or number"""
+    if isinstance(sort_value, datetime):
+        raw = f"{sort_value.isoformat()}|{row_id}"
+    else:
+        raw = json.dumps([sort_value, row_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on malformed input"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        if raw.startswith('['):
+            sort_value, row_id = json.loads(raw)
+            if not isinstance(sort_value, (str, int, float)) or isinstance(row_id, bool):
+                raise ValueError
+            return sort_value, int(row_id)
+        sort_value, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def page_size(requested, default, maximum):
+    """Clamp a ?limit= value to [1, maximum]"""
+    if requested in (None, ''):
+        return default
+    try:
+        value = int(requested)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid limit")
+    return max(1, min(value, maximum))
+
+
+def optional_page_size(requested, cursor, default, maximum):
+    """page_size for lists whose existing clients do not page yet: None (every
+    row) unless the caller sent a limit or a cursor"""
+    if requested in (None, '') and not cursor:
+        return None
+    return page_size(requested, default, maximum)
+
+
+def keyset_page(query, sort_column, id_column, cursor=None, limit=50, descending=True, key=None):
+    """Fetch one page ordered by (sort_column, id_column).
+
+    `key` maps a result row to its (sort_value, id) pair; it defaults to reading
+    the two columns off the row. Returns (rows, next_cursor), where next_cursor is
+    None on the last page; limit=None returns every remaining row.
+    """
+    if key is None:
+        key = lambda row: (getattr(row, sort_column.key), getattr(row, id_column.key))
+
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        if descending:
+            query = query.filter(or_(
+                sort_column < sort_value,
+                and_(sort_column == sort_value, id_column < row_id)
+            ))
+        else:
+            query = query.filter(or_(
+                sort_column > sort_value,
+                and_(sort_column == sort_value, id_column > row_id)
+            ))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    if limit is None:
+        return query.all(), None
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*key(rows[-1]))
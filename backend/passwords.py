@@ -0,0 +1,135 @@
+from flask import current_app
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+import bcrypt
+import threading
+
+
+# bcrypt only reads this much; bcrypt>=5 raises ValueError past it
+MAX_PASSWORD_BYTES = 72
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full or a hash times out; routes answer 503"""
+
+
+# bcrypt releases the GIL, so a small dedicated pool keeps login spikes from
+# occupying every request/socket thread while still using the spare cores.
+# Under eventlet/gevent the pool must still be native threads: a monkey-patched
+# ThreadPoolExecutor would run bcrypt on a greenlet and stall every socket.
+_executor = None
+_slots = None
+_init_lock = threading.Lock()
+# Bulk imports hash on their own pool so a large import cannot starve logins
+_bulk_executor = None
+
+
+def _pool():
+    global _executor, _slots
+    if _executor is None:
+        with _init_lock:
+            if _executor is None:
+                workers = current_app.config['PASSWORD_HASH_WORKERS']
+                _slots = threading.BoundedSemaphore(workers + current_app.config['PASSWORD_HASH_MAX_QUEUE'])
+                _executor = _native_executor(current_app.config['SOCKETIO_ASYNC_MODE'], workers)
+    return _executor, _slots
+
+
+class _TpoolExecutor:
+    """eventlet's native thread pool (EVENTLET_THREADPOOL_SIZE threads) behind submit()"""
+
+    def submit(self, fn, *args):
+        import eventlet
+        from eventlet import tpool
+
+        future = Future()
+
+        def call():
+            try:
+                future.set_result(tpool.execute(fn, *args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        eventlet.spawn_n(call)
+        return future
+
+
+def _native_executor(async_mode, workers):
+    if async_mode == 'eventlet':
+        return _TpoolExecutor()
+    if async_mode == 'gevent':
+        from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+        return GeventThreadPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+
+
+def _run(fn, *args):
+    """Run fn on the hashing pool, failing fast instead of queueing past the limit"""
+    executor, slots = _pool()
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = executor.submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=current_app.config['PASSWORD_HASH_TIMEOUT'])
+    except FutureTimeout:
+        raise HashingBusy()
+
+
+def _bulk_pool():
+    global _bulk_executor
+    if _bulk_executor is None:
+        with _init_lock:
+            if _bulk_executor is None:
+                _bulk_executor = _native_executor(
+                    current_app.config['SOCKETIO_ASYNC_MODE'],
+                    current_app.config['IMPORT_HASH_WORKERS']
+                )
+    return _bulk_executor
+
+
+def hash_many(passwords, rounds=None):
+    """Hash a batch of passwords in parallel on the import pool, preserving order"""
+    rounds = rounds or current_app.config['BCRYPT_ROUNDS']
+    executor = _bulk_pool()
+    futures = [executor.submit(_hash, password, rounds) for password in passwords]
+    return [future.result() for future in futures]
+
+
+def _stored_hash(stored):
+    """Stored hashes come back as str (utf-8 or legacy hex) or bytes"""
+    if isinstance(stored, str):
+        try:
+            return bytes.fromhex(stored)
+        except ValueError:
+            return stored.encode('utf-8')
+    return stored
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def hash_password(password, rounds=None):
+    return _run(_hash, password, rounds or current_app.config['BCRYPT_ROUNDS'])
+
+
+def check_password(password, stored):
+    """bcrypt check on the pool; raises ValueError if `stored` is not a bcrypt hash"""
+    return _run(bcrypt.checkpw, password.encode('utf-8'), _stored_hash(stored))
+
+
+def hash_cost(stored):
+    """Cost factor of a bcrypt hash ($2b$12$...), or None if it isn't one"""
+    try:
+        prefix = _stored_hash(stored).decode('utf-8').split('$')
+        return int(prefix[2])
+    except (ValueError, IndexError, UnicodeDecodeError):
+        return None
+
+
+def needs_rehash(stored):
+    return hash_cost(stored) != current_app.config['BCRYPT_ROUNDS']
@@ -0,0 +1,153 @@
+from models import db, Doctor
+from log import get_logger
+from fastjson import dumps
+from sqlalchemy import bindparam
+from collections import Counter
+from datetime import datetime, timedelta
+import atexit
+import hashlib
+import threading
+import time
+
+logger = get_logger('presence')
+
+
+class DoctorPresenceWriter:
+    """Coalesces doctor is_online/last_seen changes into one bulk UPDATE per interval.
+
+    Socket connect, disconnect and heartbeat only touch in-memory state. Every
+    `interval` seconds the changed doctors, plus every doctor with a socket on
+    this process (a server-side heartbeat), are written with a single
+    executemany keyed by doctors.user_id. The socket registry, if given, is
+    refreshed on the same tick so this worker's sockets stay registered.
+    """
+
+    def __init__(self, app, interval=15, registry=None):
+        self.app = app
+        self.interval = interval
+        self.registry = registry
+        self._local = Counter()  # doctor user_id -> sockets held by this process
+        self._dirty = {}  # doctor user_id -> is_online
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        table = Doctor.__table__
+        self._update = (
+            table.update()
+            .where(table.c.user_id == bindparam('b_user_id'))
+            .values(is_online=bindparam('b_online'), last_seen=bindparam('b_seen'))
+        )
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='doctor-presence', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def connected(self, user_id, first):
+        with self._lock:
+            self._local[int(user_id)] += 1
+            if first:
+                self._dirty[int(user_id)] = True
+
+    def disconnected(self, user_id, last):
+        user_id = int(user_id)
+        with self._lock:
+            self._local[user_id] -= 1
+            if self._local[user_id] <= 0:
+                del self._local[user_id]
+            if last:
+                self._dirty[user_id] = False
+
+    def heartbeat(self, user_id):
+        with self._lock:
+            if int(user_id) in self._local:
+                self._dirty[int(user_id)] = True
+
+    def flush(self):
+        with self._lock:
+            changes = dict.fromkeys(self._local, True)
+            changes.update(self._dirty)
+            self._dirty = {}
+        if not changes:
+            return 0
+        now = datetime.utcnow()
+        rows = [{'b_user_id': user_id, 'b_online': online, 'b_seen': now} for user_id, online in changes.items()]
+        with self.app.app_context():
+            try:
+                db.session.connection().execute(self._update, rows)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error("Doctor presence flush failed, retrying later: %s", e)
+                with self._lock:
+                    for user_id, online in changes.items():
+                        self._dirty.setdefault(user_id, online)
+                return 0
+        return len(rows)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+            if self.registry:
+                try:
+                    self.registry.refresh()
+                except Exception as e:
+                    logger.error("Socket registry refresh failed: %s", e)
+
+    def stop(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        # Doctors on this process are going away with it
+        with self._lock:
+            for user_id in self._local:
+                self._dirty[user_id] = False
+            self._local.clear()
+        self.flush()
+
+
+# Cached {doctor_id: (is_online, last_seen)} read by the patient-facing doctor lists
+_snapshot_lock = threading.Lock()
+_snapshot = None
+_snapshot_digest = None
+_snapshot_at = 0.0
+
+
+def _floor(moment, seconds):
+    """Round a datetime down to a multiple of `seconds`"""
+    offset = moment - datetime.min
+    elapsed = offset.days * 86400 + offset.seconds
+    return datetime.min + timedelta(seconds=elapsed - elapsed % seconds)
+
+
+def presence_state(max_age, timeout, last_seen_bucket=300):
+    """(snapshot, digest): presence of every doctor, at most `max_age` seconds old.
+
+    A doctor whose last_seen is older than `timeout` counts as offline, which
+    covers workers that died without writing their doctors offline. last_seen
+    is reported rounded down to `last_seen_bucket` seconds: the presence writer
+    touches it on every flush, and the digest (which feeds the directory's etag)
+    should change when someone comes or goes, not on every heartbeat.
+    """
+    global _snapshot, _snapshot_digest, _snapshot_at
+    with _snapshot_lock:
+        if _snapshot is not None and time.monotonic() - _snapshot_at < max_age:
+            return _snapshot, _snapshot_digest
+
+    cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+    rows = db.session.query(Doctor.id, Doctor.is_online, Doctor.last_seen).all()
+    snapshot = {
+        doctor_id: (
+            bool(is_online) and last_seen is not None and last_seen >= cutoff,
+            _floor(last_seen, last_seen_bucket) if last_seen else None
+        )
+        for doctor_id, is_online, last_seen in rows
+    }
+    digest = hashlib.blake2b(dumps(sorted(snapshot.items())).encode('utf-8'), digest_size=8).hexdigest()
+
+    with _snapshot_lock:
+        _snapshot, _snapshot_digest, _snapshot_at = snapshot, digest, time.monotonic()
+    return snapshot, digest
+
@@ -0,0 +1,192 @@
+"""Pieces that let more than one Socket.IO worker share the realtime tier.
+
+- A message-queue backend for cross-process emits: any URL Flask-SocketIO
+  understands (redis://, amqp://, kafka://...) or local:// for an in-process
+  stand-in that lets several servers in one interpreter (tests, benchmarks)
+  see each other's emits.
+- A presence registry mapping sockets to users, with an in-memory
+  implementation for single-worker runs and a Redis one shared by all workers.
+"""
+from socketio import PubSubManager
+import queue
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # only needed for redis:// presence registries
+    redis = None
+
+
+class LocalPubSubManager(PubSubManager):
+    """In-process pub/sub: every manager on the same channel receives every publish"""
+    name = 'local'
+
+    _channels = {}
+    _channels_lock = threading.Lock()
+
+    def __init__(self, url='local://', channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._queue = queue.Queue()
+        with self._channels_lock:
+            self._channels.setdefault(channel, []).append(self._queue)
+
+    def _publish(self, data):
+        with self._channels_lock:
+            subscribers = list(self._channels.get(self.channel, []))
+        for subscriber in subscribers:
+            subscriber.put(data)
+
+    def _listen(self):
+        while True:
+            yield self._queue.get()
+
+
+def message_queue_options(config):
+    """Extra SocketIO(...) kwargs for the configured SOCKETIO_MESSAGE_QUEUE"""
+    url = config.get('SOCKETIO_MESSAGE_QUEUE')
+    channel = config.get('SOCKETIO_CHANNEL', 'smartcare')
+    if not url:
+        return {}
+    if url.startswith('local://'):
+        return {'client_manager': LocalPubSubManager(url, channel=channel)}
+    return {'message_queue': url, 'channel': channel}
+
+
+class PresenceRegistry:
+    """Which sockets belong to which user, across every worker.
+
+    A user may hold several sockets (one per tab); register() and unregister()
+    report when the first one arrives and the last one leaves.
+    """
+
+    def register(self, user_id, sid, role=None):
+        """Returns True if this is the user's first socket"""
+        raise NotImplementedError
+
+    def unregister(self, sid):
+        """Forget a socket; returns (user_id, role, was_last) or None if it was unknown"""
+        raise NotImplementedError
+
+    def user_for(self, sid):
+        """(user_id, role) for a registered socket, or None"""
+        raise NotImplementedError
+
+    def refresh(self):
+        """Keep this worker's sockets registered; called on every presence flush"""
+
+
+class LocalPresenceRegistry(PresenceRegistry):
+    """Per-process registry; correct only while a single worker serves sockets"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sids_by_user = {}
+        self._user_by_sid = {}
+
+    def register(self, user_id, sid, role=None):
+        user_id = str(user_id)
+        with self._lock:
+            sids = self._sids_by_user.setdefault(user_id, set())
+            sids.add(sid)
+            self._user_by_sid[sid] = (user_id, role)
+            return len(sids) == 1
+
+    def unregister(self, sid):
+        with self._lock:
+            entry = self._user_by_sid.pop(sid, None)
+            if entry is None:
+                return None
+            user_id, role = entry
+            sids = self._sids_by_user.get(user_id, set())
+            sids.discard(sid)
+            if not sids:
+                self._sids_by_user.pop(user_id, None)
+            return user_id, role, not sids
+
+    def user_for(self, sid):
+        with self._lock:
+            return self._user_by_sid.get(sid)
+
+
+class RedisPresenceRegistry(PresenceRegistry):
+    """Registry kept in Redis so every worker sees it.
+
+    Each sid has a key holding "user_id:role", and each user a sorted set of
+    sids scored by expiry time. Both live for `ttl` seconds and the owning
+    worker extends them on refresh(), so the sockets of a worker that crashed
+    expire instead of keeping their users online forever.
+    """
+
+    def __init__(self, url, prefix='smartcare:presence', ttl=60):
+        if redis is None:
+            raise RuntimeError("PRESENCE_REGISTRY_URL is a redis:// URL but the redis package is not installed")
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._owned = {}  # sid -> user_id for this worker's sockets
+
+    def _user_key(self, user_id):
+        return f"{self._prefix}:sids:{user_id}"
+
+    def _sid_key(self, sid):
+        return f"{self._prefix}:sid:{sid}"
+
+    def register(self, user_id, sid, role=None):
+        key = self._user_key(user_id)
+        now = time.time()
+        pipe = self._redis.pipeline()
+        pipe.zremrangebyscore(key, '-inf', now)
+        pipe.zadd(key, {sid: now + self.ttl})
+        pipe.expire(key, self.ttl)
+        pipe.set(self._sid_key(sid), f"{user_id}:{role or ''}", ex=self.ttl)
+        pipe.zcard(key)
+        first = pipe.execute()[-1] == 1
+        with self._lock:
+            self._owned[sid] = user_id
+        return first
+
+    def unregister(self, sid):
+        with self._lock:
+            self._owned.pop(sid, None)
+        entry = self._redis.get(self._sid_key(sid))
+        if entry is None:
+            return None
+        user_id, role = entry.split(':', 1)
+        key = self._user_key(user_id)
+        pipe = self._redis.pipeline()
+        pipe.delete(self._sid_key(sid))
+        pipe.zrem(key, sid)
+        pipe.zremrangebyscore(key, '-inf', time.time())
+        pipe.zcard(key)
+        remaining = pipe.execute()[-1]
+        return user_id, role or None, remaining == 0
+
+    def user_for(self, sid):
+        entry = self._redis.get(self._sid_key(sid))
+        if entry is None:
+            return None
+        user_id, role = entry.split(':', 1)
+        return user_id, role or None
+
+    def refresh(self):
+        with self._lock:
+            owned = list(self._owned.items())
+        if not owned:
+            return
+        expires_at = time.time() + self.ttl
+        pipe = self._redis.pipeline()
+        for sid, user_id in owned:
+            key = self._user_key(user_id)
+            pipe.zadd(key, {sid: expires_at})
+            pipe.expire(key, self.ttl)
+            pipe.expire(self._sid_key(sid), self.ttl)
+        pipe.execute()
+
+
+def create_presence_registry(config):
+    url = config.get('PRESENCE_REGISTRY_URL')
+    if url and url.startswith('redis'):
+        return RedisPresenceRegistry(url, ttl=config['PRESENCE_TIMEOUT'])
+    return LocalPresenceRegistry()
@@ -0,0 +1,46 @@
+from models import db, ChatMessage
+from sqlalchemy import func, update
+from versions import bump_readers
+
+# A reader marks the other side's messages as read
+SENDER_FOR_READER = {'patient': 'doctor', 'doctor': 'patient'}
+READER_FOR_SENDER = {sender: reader for reader, sender in SENDER_FOR_READER.items()}
+
+
+def mark_read(appointment_id, reader_type, up_to_id):
+    """Mark every message the other side sent up to `up_to_id` as read in one UPDATE.
+
+    Returns the number of rows changed; 0 means the receipt was already known.
+    """
+    result = db.session.execute(
+        update(ChatMessage)
+        .where(
+            ChatMessage.appointment_id == appointment_id,
+            ChatMessage.is_read == False,
+            ChatMessage.sender_type == SENDER_FOR_READER[reader_type],
+            ChatMessage.id <= up_to_id
+        )
+        .values(is_read=True)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        bump_readers([appointment_id], reader_type)
+    db.session.commit()
+    return result.rowcount
+
+
+def unread_counts(appointment_ids, reader_type):
+    """{appointment_id: unread messages} for `reader_type`, answered from ix_chat_messages_unread"""
+    if not appointment_ids:
+        return {}
+    rows = (
+        db.session.query(ChatMessage.appointment_id, func.count())
+        .filter(
+            ChatMessage.appointment_id.in_(appointment_ids),
+            ChatMessage.is_read == False,
+            ChatMessage.sender_type == SENDER_FOR_READER[reader_type]
+        )
+        .group_by(ChatMessage.appointment_id)
+        .all()
+    )
+    return dict(rows)
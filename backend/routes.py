@@ -1,24 +1,47 @@
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import create_access_token, jwt_required
 from models import db, User, Patient, Doctor, Appointment
-import bcrypt
-import os
-from werkzeug.utils import secure_filename
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from slots import resolve_window, available_slots_for_doctors, serialize_slots
+from availability import set_availability, availability_json, invalidate_availability
+from pagination import page_size, optional_page_size, keyset_page
+from versions import bump_doctors, bump_doctor_name, bump_patient, bump_appointment_lists
+from versions import etag, not_modified, with_etag
+from serializers import doctor_appointment, patient_appointment, appointment_request, schedule_fields
+from directory import directory_state, search_doctors, invalidate_directory, directory_stats
+from identity import identity_claims, resolve_identity, invalidate_user_status
+from passwords import HashingBusy, hash_password, check_password, needs_rehash
+from storage import save_upload, send_upload
+from presence import presence_state
+from receipts import unread_counts
+from notifications import notify
+from booking import SlotTaken, book_slot
+from imports import FORMATS, PatientImport, read_rows
+from log import get_logger
+from werkzeug.exceptions import NotFound, RequestEntityTooLarge, RequestedRangeNotSatisfiable
 from datetime import datetime, timedelta
-import json
+import csv
 
 bp = Blueprint('auth', __name__, url_prefix='/api/auth')
+logger = get_logger('routes')
 
-print("Routes blueprint created")
+logger.info("Routes blueprint created")
+
+def _hashing_busy_response():
+    logger.warning("Password hashing queue saturated")
+    response = jsonify({"error": "Server busy, please retry shortly"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 @bp.route('/test', methods=['GET'])
 def test():
-    print("Test route called")
+    logger.debug("Test route called")
     return {"message": "Backend is running"}
 
 @bp.route('/debug', methods=['GET', 'POST'])
 def debug():
-    print(f"Debug route called with method: {request.method}")
+    logger.debug("Debug route called with method: %s", request.method)
     return {"message": f"Debug route working - Method: {request.method}"}
 
 @bp.route('/check-users', methods=['GET'])
@@ -39,91 +62,98 @@ def check_users():
 
 @bp.route('/login', methods=['POST', 'OPTIONS'])
 def login():
-    print(f"=== LOGIN ROUTE CALLED ===")
-    print(f"Method: {request.method}")
-    print(f"Content-Type: {request.headers.get('Content-Type')}")
-    print(f"Origin: {request.headers.get('Origin')}")
+    logger.debug("=== LOGIN ROUTE CALLED ===")
+    logger.debug("Method: %s", request.method)
+    logger.debug("Content-Type: %s", request.headers.get('Content-Type'))
+    logger.debug("Origin: %s", request.headers.get('Origin'))
     
     if request.method == 'OPTIONS':
-        print("Handling OPTIONS request")
+        logger.debug("Handling OPTIONS request")
         return jsonify({"message": "OPTIONS handled"}), 200
     
     try:
-        print("Processing login request...")
+        logger.debug("Processing login request...")
         
         try:
             data = request.get_json()
-            print(f"JSON data received: {data}")
         except Exception as json_error:
-            print(f"JSON parsing error: {json_error}")
+            logger.error("JSON parsing error: %s", json_error)
             return jsonify({"error": "Invalid JSON data"}), 400
         
         if not data:
-            print("No data received")
+            logger.warning("No data received")
             return jsonify({"error": "No data provided"}), 400
             
         email = data.get('email')
         password = data.get('password')
         
-        print(f"Email: '{email}', Password provided: {bool(password)}")
+        logger.debug("Email: '%s', Password provided: %s", email, bool(password))
 
         if not email or not password:
-            print("Missing email or password")
+            logger.warning("Missing email or password")
             return jsonify({"error": "Email and password required"}), 400
 
         user = User.query.filter_by(email=email).first()
-        print(f"User query result: {user}")
+        logger.debug("User query result: %s", user)
         
         if not user:
-            print(f"No user found with email: {email}")
+            logger.warning("No user found with email: %s", email)
             return jsonify({"error": "Invalid email or password"}), 401
 
-        print(f"User found - ID: {user.id}, Role: {user.role}")
+        logger.debug("User found - ID: %s, Role: %s", user.id, user.role)
 
         try:
-            print(f"Password check starting...")
-            print(f"Stored password type: {type(user.password)}")
-            
-            if isinstance(user.password, str):
-                try:
-                    stored_hash = bytes.fromhex(user.password)
-                except ValueError:
-                    stored_hash = user.password.encode('utf-8')
-            else:
-                stored_hash = user.password
-            
-            print(f"Hash to check against (first 20 bytes): {stored_hash[:20]}")
-            password_check = bcrypt.checkpw(password.encode('utf-8'), stored_hash)
-            print(f"Password verification result: {password_check}")
+            logger.debug("Password check starting...")
+            logger.debug("Stored password type: %s", type(user.password))
+            password_check = check_password(password, user.password)
+            logger.debug("Password verification result: %s", password_check)
             
+        except HashingBusy:
+            raise
         except Exception as pwd_error:
-            print(f"Password check error: {pwd_error}")
-            print(f"Trying alternative password check methods...")
+            logger.warning("Password check error: %s", pwd_error)
+            logger.warning("Trying alternative password check methods...")
             
             if user.password == password:
-                print("WARNING: Password stored as plain text!")
+                logger.warning("Password stored as plain text for user: %s", user.id)
                 password_check = True
             else:
-                print("All password check methods failed")
+                logger.warning("All password check methods failed")
                 return jsonify({"error": "Authentication error"}), 401
         
         if not password_check:
-            print("Password verification failed")
+            logger.warning("Password verification failed")
             return jsonify({"error": "Invalid email or password"}), 401
 
+        # Transparent upgrade when BCRYPT_ROUNDS changed (or the password was stored in plain text)
+        if needs_rehash(user.password):
+            try:
+                user.password = hash_password(password)
+                db.session.commit()
+                logger.info("Password rehashed for user: %s", user.id)
+            except Exception as rehash_error:
+                db.session.rollback()
+                logger.warning("Password rehash skipped: %s", rehash_error)
+
+        doctor = patient = None
         if user.role == 'doctor':
             doctor = Doctor.query.filter_by(user_id=user.id).first()
             if not doctor or not doctor.is_approved:
-                print("Doctor not approved")
+                logger.warning("Doctor not approved")
                 return jsonify({"error": "Doctor account not approved by admin"}), 403
+        elif user.role == 'patient':
+            patient = Patient.query.filter_by(user_id=user.id).first()
 
-        if hasattr(user, 'is_active') and not user.is_active:
-            print("User account inactive")
+        if user.is_blocked or (hasattr(user, 'is_active') and not user.is_active):
+            logger.warning("User account inactive")
             return jsonify({"error": "Account is blocked"}), 403
 
         try:
-            access_token = create_access_token(identity=str(user.id))
-            print(f"Login successful for user: {email}")
+            access_token = create_access_token(
+                identity=str(user.id),
+                additional_claims=identity_claims(user, doctor, patient)
+            )
+            logger.info("Login successful for user: %s", email)
             
             return jsonify({
                 "access_token": access_token, 
@@ -132,19 +162,19 @@ def login():
                 "message": "Login successful"
             }), 200
         except Exception as token_error:
-            print(f"Token creation error: {token_error}")
+            logger.error("Token creation error: %s", token_error)
             return jsonify({"error": "Token creation failed"}), 500
     
+    except HashingBusy:
+        return _hashing_busy_response()
     except Exception as e:
-        print(f"Login error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Login error: %s", e)
         return jsonify({"error": "Login failed"}), 500
 
 @bp.route('/signup/patient', methods=['POST'])
 def signup_patient():
     try:
-        print("Patient signup called")
+        logger.debug("Patient signup called")
         data = request.get_json()
         email = data.get('email')
         password = data.get('password')
@@ -159,27 +189,32 @@ def signup_patient():
         if User.query.filter_by(email=email).first():
             return jsonify({"error": "Email already exists"}), 400
 
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        hashed_password = hash_password(password)
         user = User(email=email, password=hashed_password, role='patient')
         db.session.add(user)
-        db.session.commit()
+        db.session.flush()
 
         patient = Patient(user_id=user.id, name=name, age=age, gender=gender, medical_history=medical_history)
         db.session.add(patient)
         db.session.commit()
 
-        print(f"Patient registered successfully: {email}")
+        logger.info("Patient registered successfully: %s", email)
         return jsonify({"message": "Patient registered successfully"}), 201
     
+    except HashingBusy:
+        return _hashing_busy_response()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "Email already exists"}), 400
     except Exception as e:
-        print(f"Patient signup error: {e}")
+        logger.error("Patient signup error: %s", e)
         db.session.rollback()
         return jsonify({"error": "Registration failed"}), 500
 
 @bp.route('/signup/doctor', methods=['POST'])
 def signup_doctor():
     try:
-        print("Doctor signup called")
+        logger.debug("Doctor signup called")
         
         email = request.form.get('email')
         password = request.form.get('password')
@@ -201,10 +236,7 @@ def signup_doctor():
                 if file and file.filename:
                     if not (file.filename.lower().endswith(('.pdf', '.doc', '.docx'))):
                         return jsonify({"error": "Documents must be PDF or Word files"}), 400
-                    filename = secure_filename(file.filename)
-                    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                    file.save(file_path)
-                    document_paths.append(filename)
+                    document_paths.append(save_upload(file))
         
         photo_path = None
         if 'photo' in request.files:
@@ -212,15 +244,12 @@ def signup_doctor():
             if file and file.filename:
                 if not (file.filename.lower().endswith(('.jpg', '.jpeg', '.png'))):
                     return jsonify({"error": "Photo must be JPG, JPEG, or PNG"}), 400
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
-                photo_path = filename
+                photo_path = save_upload(file)
 
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        hashed_password = hash_password(password)
         user = User(email=email, password=hashed_password, role='doctor')
         db.session.add(user)
-        db.session.commit()
+        db.session.flush()
 
         doctor = Doctor(
             user_id=user.id,
@@ -235,8 +264,16 @@ def signup_doctor():
 
         return jsonify({"message": "Doctor registration pending admin approval"}), 201
     
+    except HashingBusy:
+        return _hashing_busy_response()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "Email already exists"}), 400
+    except RequestEntityTooLarge as e:
+        db.session.rollback()
+        return jsonify({"error": e.description}), 413
     except Exception as e:
-        print(f"Doctor signup error: {e}")
+        logger.error("Doctor signup error: %s", e)
         db.session.rollback()
         return jsonify({"error": "Registration failed"}), 500
 
@@ -244,71 +281,77 @@ def signup_doctor():
 @jwt_required()
 def get_pending_doctors():
     try:
-        print("=== PENDING DOCTORS ROUTE CALLED ===")
-        print(f"Authorization header: {request.headers.get('Authorization')}")
-        
-        user_id_str = get_jwt_identity()
-        print(f"JWT Identity (raw): {user_id_str}")
+        logger.debug("=== PENDING DOCTORS ROUTE CALLED ===")
         
+        identity, error = resolve_identity('admin')
+        if error:
+            logger.warning("Unauthorized access to pending doctors")
+            return error
+
+        # Oldest applications first; declined doctors (inactive users) drop out of the queue
         try:
-            user_id = int(user_id_str)
-            print(f"Converted user_id: {user_id}")
-        except (ValueError, TypeError) as e:
-            print(f"Error converting user_id: {e}")
-            return jsonify({"error": "Invalid token"}), 401
-        
-        user = User.query.get(user_id)
-        if not user:
-            print(f"No user found with ID: {user_id}")
-            return jsonify({"error": "User not found"}), 404
-            
-        print(f"User role: {user.role}")
-        if user.role != 'admin':
-            print("Unauthorized access to pending doctors")
-            return jsonify({"error": "Admin access required"}), 403
+            rows, next_cursor = keyset_page(
+                db.session.query(Doctor, User.email)
+                .join(User, Doctor.user_id == User.id)
+                .filter(Doctor.is_approved == False, User.is_active == True),
+                Doctor.created_at,
+                Doctor.id,
+                cursor=request.args.get('cursor'),
+                limit=optional_page_size(
+                    request.args.get('limit'),
+                    request.args.get('cursor'),
+                    current_app.config['ADMIN_PAGE_SIZE'],
+                    current_app.config['MAX_PAGE_SIZE']
+                ),
+                descending=False,
+                key=lambda row: (row[0].created_at, row[0].id)
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        pending_doctors = Doctor.query.filter_by(is_approved=False).all()
         doctors_list = [
             {
                 "id": doctor.id,
                 "user_id": doctor.user_id,
                 "name": doctor.name,
-                "email": doctor.user.email,
+                "email": email,
                 "specialization": doctor.specialization,
                 "documents": doctor.documents.split(',') if doctor.documents else [],
                 "photo": doctor.photo
             }
-            for doctor in pending_doctors
+            for doctor, email in rows
         ]
-        print(f"Returning {len(doctors_list)} pending doctors")
-        return jsonify({"doctors": doctors_list}), 200
+        logger.debug("Returning %s pending doctors", len(doctors_list))
+        return jsonify({
+            "doctors": doctors_list,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
+        }), 200
     
     except Exception as e:
-        print(f"Error fetching pending doctors: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error fetching pending doctors: %s", e)
         return jsonify({"error": "Failed to fetch pending doctors"}), 500
 
 @bp.route('/admin/approve-doctor/<int:doctor_id>', methods=['POST'])
 @jwt_required()
 def approve_doctor(doctor_id):
     try:
-        user_id_str = get_jwt_identity()
-        user_id = int(user_id_str)
-        user = User.query.get(user_id)
-        
-        if not user or user.role != 'admin':
-            print("Unauthorized access to approve doctor")
-            return jsonify({"error": "Admin access required"}), 403
+        identity, error = resolve_identity('admin')
+        if error:
+            logger.warning("Unauthorized access to approve doctor")
+            return error
 
         doctor = Doctor.query.get_or_404(doctor_id)
         doctor.is_approved = True
+        bump_doctors([doctor.id])
         db.session.commit()
-        print(f"Doctor {doctor.name} approved")
+        invalidate_user_status(doctor.user_id)
+        invalidate_directory()
+        logger.info("Doctor %s approved", doctor.name)
         return jsonify({"message": f"Doctor {doctor.name} approved successfully"}), 200
     
     except Exception as e:
-        print(f"Error approving doctor: {e}")
+        logger.error("Error approving doctor: %s", e)
         db.session.rollback()
         return jsonify({"error": "Failed to approve doctor"}), 500
 
@@ -316,184 +359,265 @@ def approve_doctor(doctor_id):
 @jwt_required()
 def decline_doctor(doctor_id):
     try:
-        user_id_str = get_jwt_identity()
-        user_id = int(user_id_str)
-        user = User.query.get(user_id)
-        
-        if not user or user.role != 'admin':
-            print("Unauthorized access to decline doctor")
-            return jsonify({"error": "Admin access required"}), 403
+        identity, error = resolve_identity('admin')
+        if error:
+            logger.warning("Unauthorized access to decline doctor")
+            return error
 
         doctor = Doctor.query.get_or_404(doctor_id)
         user = User.query.get_or_404(doctor.user_id)
         user.is_active = False
+        user.is_blocked = True
+        bump_doctors([doctor.id])
         db.session.commit()
-        print(f"Doctor {doctor.name} declined")
+        invalidate_user_status(user.id)
+        invalidate_directory()
+        logger.info("Doctor %s declined", doctor.name)
         return jsonify({"message": f"Doctor {doctor.name} declined successfully"}), 200
     
     except Exception as e:
-        print(f"Error declining doctor: {e}")
+        logger.error("Error declining doctor: %s", e)
         db.session.rollback()
         return jsonify({"error": "Failed to decline doctor"}), 500
 
-@bp.route('/uploads/<filename>', methods=['GET'])
+def _bulk_doctor_ids():
+    """doctor_ids from a bulk moderation body; raises ValueError on bad input"""
+    data = request.get_json(silent=True) or {}
+    doctor_ids = data.get('doctor_ids')
+    if not isinstance(doctor_ids, list) or not doctor_ids:
+        raise ValueError("doctor_ids must be a non-empty list")
+    if len(doctor_ids) > current_app.config['ADMIN_BULK_MAX']:
+        raise ValueError(f"At most {current_app.config['ADMIN_BULK_MAX']} doctors per request")
+    try:
+        return sorted({int(doctor_id) for doctor_id in doctor_ids})
+    except (TypeError, ValueError):
+        raise ValueError("doctor_ids must be integers")
+
+def _bulk_moderate(approve):
+    """Approve or decline many doctors in one transaction: one SELECT, one UPDATE, one commit"""
+    identity, error = resolve_identity('admin')
+    if error:
+        return error
+    try:
+        doctor_ids = _bulk_doctor_ids()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        found = dict(
+            db.session.query(Doctor.id, Doctor.user_id)
+            .filter(Doctor.id.in_(doctor_ids))
+            .all()
+        )
+        if found:
+            if approve:
+                db.session.execute(
+                    update(Doctor).where(Doctor.id.in_(list(found))).values(is_approved=True)
+                )
+            else:
+                db.session.execute(
+                    update(User).where(User.id.in_(list(found.values()))).values(is_active=False, is_blocked=True)
+                )
+            bump_doctors(list(found))
+            db.session.commit()
+            for user_id in found.values():
+                invalidate_user_status(user_id)
+            invalidate_directory()
+
+        action = "approved" if approve else "declined"
+        logger.info("Bulk %s %s doctors", action, len(found))
+        return jsonify({
+            action: sorted(found),
+            "not_found": [doctor_id for doctor_id in doctor_ids if doctor_id not in found]
+        }), 200
+    except Exception as e:
+        logger.error("Bulk moderation error: %s", e)
+        db.session.rollback()
+        return jsonify({"error": "Failed to update doctors"}), 500
+
+@bp.route('/admin/doctors/bulk-approve', methods=['POST'])
+@jwt_required()
+def bulk_approve_doctors():
+    return _bulk_moderate(approve=True)
+
+@bp.route('/admin/doctors/bulk-decline', methods=['POST'])
+@jwt_required()
+def bulk_decline_doctors():
+    return _bulk_moderate(approve=False)
+
+@bp.route('/admin/patients/import', methods=['POST'])
+@jwt_required()
+def import_patients():
+    """Onboard patients from a CSV or NDJSON body, streamed row by row"""
+    identity, error = resolve_identity('admin')
+    if error:
+        return error
+
+    fmt = FORMATS.get(request.mimetype)
+    if not fmt:
+        return jsonify({"error": "Send text/csv or application/x-ndjson"}), 415
+    request.max_content_length = current_app.config['IMPORT_MAX_BYTES']
+
+    job = PatientImport(
+        batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+        max_errors=current_app.config['IMPORT_MAX_ERRORS']
+    )
+    try:
+        for number, row, row_error in read_rows(request.stream, fmt):
+            job.add(number, row, row_error)
+        job.flush()
+    except RequestEntityTooLarge as e:
+        db.session.rollback()
+        return jsonify({"error": e.description, **job.report()}), 413
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        return jsonify({"error": f"Unreadable import body: {e}", **job.report()}), 400
+    except Exception as e:
+        logger.exception("Patient import error: %s", e)
+        db.session.rollback()
+        return jsonify({"error": "Import failed", **job.report()}), 500
+
+    report = job.report()
+    logger.info("Patient import: %s imported, %s failed", report['imported'], report['failed'])
+    return jsonify(report), 200
+
+@bp.route('/admin/directory-cache', methods=['GET'])
+@jwt_required()
+def get_directory_cache_stats():
+    identity, error = resolve_identity('admin')
+    if error:
+        return error
+    return jsonify(directory_stats()), 200
+
+@bp.route('/uploads/<path:filename>', methods=['GET'])
 def serve_uploaded_file(filename):
     try:
-        print(f"Serving file: {filename}")
-        return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+        logger.debug("Serving file: %s", filename)
+        if filename.startswith('.'):
+            # in-flight uploads live under .incoming/
+            return jsonify({"error": "File not found"}), 404
+        return send_upload(filename)
+    except RequestedRangeNotSatisfiable:
+        raise
+    except NotFound:
+        return jsonify({"error": "File not found"}), 404
     except Exception as e:
-        print(f"Error serving file {filename}: {e}")
+        logger.error("Error serving file %s: %s", filename, e)
         return jsonify({"error": "File not found"}), 404
 
 @bp.route('/doctor/appointments', methods=['GET'])
 @jwt_required()
 def get_doctor_appointments():
     try:
-        user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
-        if not user or user.role != 'doctor':
-            return jsonify({"error": "Doctor access required"}), 403
-
-        doctor = Doctor.query.filter_by(user_id=user_id).first()
-        if not doctor:
-            return jsonify({"error": "Doctor not found"}), 404
-
-    
-        rows = (
-            db.session.query(Appointment, Patient, User)
+        identity, error = resolve_identity('doctor')
+        if error:
+            return error
+
+        version = db.session.query(Doctor.appointments_version).filter(Doctor.id == identity.doctor_id).scalar()
+        tag = etag('doctor-appointments', identity.doctor_id, version, query=True)
+        unchanged = not_modified(tag)
+        if unchanged:
+            return unchanged
+
+        query = (
+            db.session.query(Appointment, Patient)
             .join(Patient, Appointment.patient_id == Patient.id)
-            .join(User, Patient.user_id == User.id)
-            .filter(Appointment.doctor_id == doctor.id)
-            .all()
+            .filter(
+                Appointment.doctor_id == identity.doctor_id,
+                # the dashboard only lists these; filtering here keeps pages full
+                Appointment.status.in_(('accepted', 'pending'))
+            )
         )
+        status = request.args.get('status')
+        if status:
+            query = query.filter(Appointment.status == status)
+
+        try:
+            limit = optional_page_size(
+                request.args.get('limit'),
+                request.args.get('cursor'),
+                current_app.config['APPOINTMENTS_PAGE_SIZE'],
+                current_app.config['MAX_PAGE_SIZE']
+            )
+            rows, next_cursor = keyset_page(
+                query,
+                Appointment.start_time,
+                Appointment.id,
+                cursor=request.args.get('cursor'),
+                limit=limit,
+                key=lambda row: (row[0].start_time, row[0].id)
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         scheduled = []
         pending = []
+        unread = unread_counts([appt.id for appt, _ in rows], 'doctor')
 
-        for appt, patient, _ in rows:
-            scheduled.append({
-                "id": appt.id,
-                "patient": {
-                    "id": patient.id,
-                    "name": patient.name,
-                    "age": patient.age,
-                    "gender": patient.gender,
-                    "medical_history": patient.medical_history
-                },
-                "appointment_type": appt.appointment_type,
-                "start_time": appt.start_time.isoformat(),
-                "end_time": appt.end_time.isoformat(),
-                "status": appt.status,
-                "symptoms": appt.symptoms,
-                "report_file": appt.report_file
-            }) if appt.status == 'accepted' else None
-
-            pending.append({
-                "id": appt.id,
-                "patient": {
-                    "id": patient.id,
-                    "name": patient.name,
-                    "age": patient.age,
-                    "gender": patient.gender,
-                    "medical_history": patient.medical_history
-                },
-                "appointment_type": appt.appointment_type,
-                "start_time": appt.start_time.isoformat(),
-                "end_time": appt.end_time.isoformat(),
-                "status": appt.status,
-                "symptoms": appt.symptoms,
-                "report_file": appt.report_file
-            }) if appt.status == 'pending' else None
-
-        
-        scheduled = [s for s in scheduled if s]
-        pending   = [p for p in pending if p]
-
-        return jsonify({"scheduled": scheduled, "pending": pending}), 200
+        for appt, patient in rows:
+            item = doctor_appointment(appt, patient, unread.get(appt.id, 0))
+            if appt.status == 'accepted':
+                scheduled.append(item)
+            else:
+                pending.append(item)
+
+        return with_etag(jsonify({
+            "scheduled": scheduled,
+            "pending": pending,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
+        }), tag)
     except Exception as e:
-        print("Doctor appointments error:", e)
+        logger.error("Doctor appointments error: %s", e)
         return jsonify({"error": "Failed to fetch appointments"}), 500
     
 def _handle_appointment(appointment_id, new_status):
     try:
-        user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
-        if not user or user.role != 'doctor':
-            return jsonify({"error": "Doctor access required"}), 403
-
-        doctor = Doctor.query.filter_by(user_id=user_id).first()
-        if not doctor:
-            return jsonify({"error": "Doctor not found"}), 404
+        identity, error = resolve_identity('doctor')
+        if error:
+            return error
 
-        appointment = Appointment.query.filter_by(
-            id=appointment_id, 
-            doctor_id=doctor.id
-        ).first()
+        row = (
+            db.session.query(Appointment, Patient.user_id)
+            .join(Patient, Appointment.patient_id == Patient.id)
+            .filter(Appointment.id == appointment_id, Appointment.doctor_id == identity.doctor_id)
+            .first()
+        )
         
-        if not appointment:
+        if not row:
             return jsonify({"error": "Appointment not found or not yours"}), 404
+        appointment, patient_user_id = row
 
-        print(f"Updating appointment {appointment_id} to {new_status}")
+        logger.debug("Updating appointment %s to %s", appointment_id, new_status)
         appointment.status = new_status
         
         
         if new_status == 'accepted' and appointment.appointment_type == 'instant':
             appointment.chat_active = True
+        chat_active = bool(appointment.chat_active)
+        patient_id, doctor_id = appointment.patient_id, appointment.doctor_id
+
+        # Sent by the dispatcher once this commits; every tab of the patient is in the room
+        notify(db.session, f"patient_{patient_user_id}", 'appointment_updated', {
+            'appointment_id': appointment_id,
+            'status': new_status,
+            'chat_active': chat_active if new_status == 'accepted' else False
+        }, key=appointment_id)
+        bump_appointment_lists(doctor_id, patient_id)
             
         db.session.commit()
-        print(f"Appointment {appointment_id} updated successfully to {new_status}")
-        
-        
-        try:
-            from app import socketio
-            
-            # Get patient info
-            patient = Patient.query.get(appointment.patient_id)
-            if patient:
-                # Use user_id directly for consistency with socket_handlers.py
-                room_name = f"patient_{patient.user_id}"
-                
-                emit_data = {
-                    'appointment_id': appointment_id,
-                    'status': new_status,
-                    'chat_active': appointment.chat_active if new_status == 'accepted' else False
-                }
-                
-                print(f"=== EMITTING TO PATIENT ===")
-                print(f"Room: {room_name}")
-                print(f"Data: {emit_data}")
-                print(f"Patient ID: {patient.id}, User ID: {patient.user_id}")
-                
-                # First emit to all connected clients for debugging
-                socketio.emit('debug_appointment_updated', {
-                    'target_room': room_name,
-                    'data': emit_data,
-                    'timestamp': datetime.utcnow().isoformat()
-                })
-                
-                # Then emit to the specific room
-                socketio.emit('appointment_updated', emit_data, room=room_name)
-                print(f"✅ Emission complete")
-                
-                # Also emit to the specific socket ID if we can find it
-                try:
-                    from socket_handlers import get_patient_socket_id
-                    socket_id = get_patient_socket_id(patient.user_id)
-                    if socket_id:
-                        print(f"🎯 Emitting directly to socket ID: {socket_id}")
-                        socketio.emit('appointment_updated', emit_data, room=socket_id)
-                except Exception as sid_error:
-                    print(f"⚠️ Could not emit to socket ID: {sid_error}")
-                
-        except Exception as ws_error:
-            print(f"❌ WebSocket error: {ws_error}")
+        logger.info("Appointment %s updated successfully to %s", appointment_id, new_status)
+
+        from socket_handlers import cache_appointment_room, evict_appointment_room
+        if chat_active:
+            cache_appointment_room(appointment_id, patient_id, doctor_id, True)
+        else:
+            evict_appointment_room(appointment_id)
         
         return jsonify({"message": f"Appointment {new_status} successfully"}), 200
         
     except Exception as e:
-        print(f"Handle appointment error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Handle appointment error: %s", e)
         db.session.rollback()
         return jsonify({"error": "Failed to update appointment"}), 500
 
@@ -511,27 +635,42 @@ def reject_appointment(appointment_id):
 @jwt_required()
 def manage_doctor_profile():
     try:
-        user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
-        if not user or user.role != 'doctor':
-            return jsonify({"error": "Doctor access required"}), 403
+        identity, error = resolve_identity('doctor')
+        if error:
+            return error
 
-        doctor = Doctor.query.filter_by(user_id=user_id).first()
-        if not doctor:
+        if request.method == 'GET':
+            version = db.session.query(Doctor.version).filter(Doctor.id == identity.doctor_id).scalar()
+            if version is None:
+                return jsonify({"error": "Doctor not found"}), 404
+            tag = etag('doctor', identity.doctor_id, version)
+            unchanged = not_modified(tag)
+            if unchanged:
+                return unchanged
+
+        row = (
+            db.session.query(Doctor, User)
+            .join(User, Doctor.user_id == User.id)
+            .filter(Doctor.id == identity.doctor_id)
+            .first()
+        )
+        if not row:
             return jsonify({"error": "Doctor not found"}), 404
+        doctor, user = row
+        user_id = user.id
 
         if request.method == 'GET':
-            return jsonify({
+            return with_etag(jsonify({
                 "user_id": user_id,
                 "name": doctor.name,
                 "email": user.email,
                 "specialization": doctor.specialization,
-                "availability": json.loads(doctor.availability) if doctor.availability else {},
+                "availability": availability_json(doctor.id, fresh=True),
                 "instant_available": doctor.instant_available,
                 "is_active": user.is_active,
                 "photo": doctor.photo,
                 "pricing": doctor.pricing or 0.0        # ⬅️ new
-            }), 200
+            }), tag)
 
         if request.method == 'POST':
             data = request.form
@@ -541,15 +680,16 @@ def manage_doctor_profile():
             pricing_str = data.get('pricing')
             photo = request.files.get('photo')
 
-            if name:
+            if name and name != doctor.name:
                 doctor.name = name
+                bump_doctor_name(doctor.id)
             if specialization:
                 doctor.specialization = specialization
             if availability:
                 try:
-                    json.loads(availability)
-                    doctor.availability = availability
-                except json.JSONDecodeError:
+                    set_availability(doctor, availability)
+                except ValueError:
+                    db.session.rollback()
                     return jsonify({"error": "Invalid availability format"}), 400
             if pricing_str is not None:
                 try:
@@ -559,40 +699,44 @@ def manage_doctor_profile():
             if photo and photo.filename:
                 if not (photo.filename.lower().endswith(('.jpg', '.jpeg', '.png'))):
                     return jsonify({"error": "Photo must be JPG, JPEG, or PNG"}), 400
-                filename = secure_filename(photo.filename)
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                photo.save(file_path)
-                doctor.photo = filename
+                doctor.photo = save_upload(photo)
 
+            bump_doctors([doctor.id])
             db.session.commit()
-            print(f"Doctor profile updated: {doctor.name}, pricing: {doctor.pricing}")
+            invalidate_availability(doctor.id)
+            invalidate_directory()
+            logger.debug("Doctor profile updated: %s, pricing: %s", doctor.name, doctor.pricing)
             return jsonify({"message": "Profile updated successfully"}), 200
 
+    except RequestEntityTooLarge as e:
+        db.session.rollback()
+        return jsonify({"error": e.description}), 413
     except Exception as e:
-        print(f"Error managing profile: {e}")
+        logger.error("Error managing profile: %s", e)
         db.session.rollback()
         return jsonify({"error": "Failed to manage profile"}), 500
 @bp.route('/doctor/toggle-instant', methods=['POST'])
 @jwt_required()
 def toggle_instant():
     try:
-        user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
-        if not user or user.role != 'doctor':
-            print("Unauthorized access to toggle instant")
-            return jsonify({"error": "Doctor access required"}), 403
+        identity, error = resolve_identity('doctor')
+        if error:
+            logger.warning("Unauthorized access to toggle instant")
+            return error
 
-        doctor = Doctor.query.filter_by(user_id=user_id).first()
+        doctor = Doctor.query.get(identity.doctor_id)
         if not doctor:
             return jsonify({"error": "Doctor not found"}), 404
 
         doctor.instant_available = not doctor.instant_available
+        bump_doctors([doctor.id])
         db.session.commit()
-        print(f"Instant availability toggled to: {doctor.instant_available}")
+        invalidate_directory()
+        logger.debug("Instant availability toggled to: %s", doctor.instant_available)
         return jsonify({"message": "Instant availability updated", "instant_available": doctor.instant_available}), 200
     
     except Exception as e:
-        print(f"Error toggling instant availability: {e}")
+        logger.error("Error toggling instant availability: %s", e)
         db.session.rollback()
         return jsonify({"error": "Failed to toggle instant availability"}), 500
 
@@ -600,19 +744,22 @@ def toggle_instant():
 @jwt_required()
 def toggle_active():
     try:
-        user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
-        if not user or user.role != 'doctor':
-            print("Unauthorized access to toggle active")
-            return jsonify({"error": "Doctor access required"}), 403
+        identity, error = resolve_identity('doctor')
+        if error:
+            logger.warning("Unauthorized access to toggle active")
+            return error
 
+        user = User.query.get(identity.user_id)
         user.is_active = not user.is_active
+        bump_doctors([identity.doctor_id])
         db.session.commit()
-        print(f"Active status toggled to: {user.is_active}")
+        invalidate_user_status(user.id)
+        invalidate_directory()
+        logger.debug("Active status toggled to: %s", user.is_active)
         return jsonify({"message": "Active status updated", "is_active": user.is_active}), 200
     
     except Exception as e:
-        print(f"Error toggling active status: {e}")
+        logger.error("Error toggling active status: %s", e)
         db.session.rollback()
         return jsonify({"error": "Failed to toggle active status"}), 500
 
@@ -620,89 +767,133 @@ def toggle_active():
 def get_available_slots(doctor_id):
     try:
         doctor = Doctor.query.get_or_404(doctor_id)
-        if not doctor.availability:
-            return jsonify({"slots": {}}), 200
-
-        availability = json.loads(doctor.availability)
-        appointments = Appointment.query.filter_by(doctor_id=doctor_id, status='accepted').all()
-        booked_slots = []
-        for appt in appointments:
-            booked_slots.append({
-                "start": appt.start_time,
-                "end": appt.end_time
-            })
 
-        available_slots = {}
-        for day, time_ranges in availability.items():
-            available_slots[day] = []
-            for time_range in time_ranges:
-                start, end = time_range.split('-')
-                start_time = datetime.strptime(start, '%H:%M')
-                end_time = datetime.strptime(end, '%H:%M')
-                current = start_time
-                while current < end_time:
-                    slot_start = current
-                    slot_end = (datetime.combine(datetime.today(), current.time()) + timedelta(minutes=25)).time()
-                    if slot_end > end_time.time():
-                        break
-                    slot_available = True
-                    for booked in booked_slots:
-                        booked_start = booked["start"]
-                        booked_end = booked["end"]
-                        slot_start_dt = datetime.combine(datetime.today(), slot_start.time())
-                        slot_end_dt = datetime.combine(datetime.today(), slot_end)
-                        if (slot_start_dt < booked_end and slot_end_dt > booked_start):
-                            slot_available = False
-                            break
-                    if slot_available:
-                        available_slots[day].append(f"{slot_start.strftime('%H:%M')}-{slot_end.strftime('%H:%M')}")
-                    current = (datetime.combine(datetime.today(), current.time()) + timedelta(minutes=25)).time()
-        return jsonify({"slots": available_slots}), 200
+        try:
+            start_date, end_date = resolve_window(
+                request.args.get('start_date'),
+                request.args.get('end_date'),
+                request.args.get('days')
+            )
+        except ValueError as e:
+            return jsonify({"error": f"Invalid date range: {e}"}), 400
+
+        slots = available_slots_for_doctors([doctor.id], start_date, end_date)
+        return jsonify(serialize_slots(slots.get(doctor.id, {}))), 200
     
     except Exception as e:
-        print(f"Error fetching available slots: {e}")
+        logger.error("Error fetching available slots: %s", e)
+        return jsonify({"error": "Failed to fetch available slots"}), 500
+
+@bp.route('/doctor/available-slots', methods=['GET'])
+def get_available_slots_batch():
+    try:
+        try:
+            doctor_ids = [int(i) for i in request.args.get('doctor_ids', '').split(',') if i.strip()]
+            start_date, end_date = resolve_window(
+                request.args.get('start_date'),
+                request.args.get('end_date'),
+                request.args.get('days')
+            )
+        except ValueError as e:
+            return jsonify({"error": f"Invalid parameters: {e}"}), 400
+
+        if not doctor_ids:
+            return jsonify({"error": "doctor_ids required"}), 400
+        if len(doctor_ids) > current_app.config['SLOTS_BATCH_MAX']:
+            return jsonify({"error": f"At most {current_app.config['SLOTS_BATCH_MAX']} doctors per request"}), 400
+
+        doctors = Doctor.query.filter(Doctor.id.in_(doctor_ids)).all()
+        slots = available_slots_for_doctors([doctor.id for doctor in doctors], start_date, end_date)
+        return jsonify({
+            "doctors": {
+                str(doctor.id): serialize_slots(slots.get(doctor.id, {}))
+                for doctor in doctors
+            }
+        }), 200
+
+    except Exception as e:
+        logger.error("Error fetching available slots: %s", e)
         return jsonify({"error": "Failed to fetch available slots"}), 500
 
+def _presence():
+    """(snapshot, digest) of doctor presence, refreshed at most once per flush interval"""
+    return presence_state(
+        current_app.config['PRESENCE_FLUSH_INTERVAL'],
+        current_app.config['PRESENCE_TIMEOUT'],
+        current_app.config['PRESENCE_LAST_SEEN_BUCKET']
+    )
+
+def _with_presence(doctors, presence):
+    """Overlay is_online/last_seen from a presence snapshot on serialized doctors"""
+    with_presence = []
+    for doctor in doctors:
+        is_online, last_seen = presence.get(doctor["id"], (False, None))
+        with_presence.append({
+            **doctor,
+            "is_online": is_online,
+            "last_seen": last_seen.isoformat() if last_seen else None
+        })
+    return with_presence
+
 @bp.route('/patient/doctors', methods=['GET'])
 @jwt_required()
 def get_approved_doctors():
     try:
-        user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
-        if not user or user.role != 'patient':
-            return jsonify({"error": "Patient access required"}), 403
-
-        doctors = Doctor.query.filter_by(is_approved=True).all()
-        doctors_list = [
-            {
-                "id": doctor.id,
-                "name": doctor.name,
-                "specialization": doctor.specialization,
-                "instant_available": doctor.instant_available,
-                "is_active": doctor.user.is_active,
-                # REMOVE: "is_online": doctor.is_online,
-                "availability": json.loads(doctor.availability) if doctor.availability else {},
-                "photo": doctor.photo or None,
-            }
-            for doctor in doctors if doctor.user.is_active
-        ]
-        return jsonify({"doctors": doctors_list}), 200
+        identity, error = resolve_identity('patient')
+        if error:
+            return error
+
+        # The directory is cached until doctors change; presence changes far more
+        # often, so it is overlaid from a short-lived snapshot instead. Both carry
+        # a digest, so an unchanged poll is answered without serializing anything.
+        doctors, directory_tag = directory_state()
+        presence, presence_tag = _presence()
+        tag = etag('doctors', directory_tag, presence_tag)
+        unchanged = not_modified(tag)
+        if unchanged:
+            return unchanged
+        return with_etag(jsonify({"doctors": _with_presence(doctors, presence)}), tag)
     except Exception as e:
-        print(f"Error fetching doctors: {e}")
+        logger.error("Error fetching doctors: %s", e)
         return jsonify({"error": "Failed to fetch doctors"}), 500
+
+@bp.route('/patient/doctors/search', methods=['GET'])
+@jwt_required()
+def search_approved_doctors():
+    try:
+        identity, error = resolve_identity('patient')
+        if error:
+            return error
+
+        try:
+            doctors, next_cursor = search_doctors(
+                request.args,
+                page_size(
+                    request.args.get('limit'),
+                    current_app.config['DOCTOR_SEARCH_PAGE_SIZE'],
+                    current_app.config['MAX_PAGE_SIZE']
+                ),
+                cursor=request.args.get('cursor')
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return jsonify({
+            "doctors": _with_presence(doctors, _presence()[0]),
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
+        }), 200
+    except Exception as e:
+        logger.error("Error searching doctors: %s", e)
+        return jsonify({"error": "Failed to search doctors"}), 500
     
 @bp.route('/patient/book-appointment', methods=['POST'])
 @jwt_required()
 def book_appointment():
     try:
-        user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
-        if not user or user.role != 'patient':
-            return jsonify({"error": "Patient access required"}), 403
-
-        patient = Patient.query.filter_by(user_id=user_id).first()
-        if not patient:
-            return jsonify({"error": "Patient not found"}), 404
+        identity, error = resolve_identity('patient')
+        if error:
+            return error
 
         data = request.form
         doctor_id = int(data.get('doctor_id'))
@@ -727,88 +918,88 @@ def book_appointment():
             start_dt = datetime.fromisoformat(start_time_str.replace('Z', '+00:00'))
             end_dt = datetime.fromisoformat(end_time_str.replace('Z', '+00:00'))
         except Exception as e:
-            print(f"DateTime parsing error: {e}")
+            logger.error("DateTime parsing error: %s", e)
             return jsonify({"error": "Invalid datetime format"}), 400
 
         # Validate times
         if start_dt >= end_dt:
             return jsonify({"error": "End time must be after start time"}), 400
 
-        # Check for overlaps
-        overlap = Appointment.query.filter(
-            Appointment.doctor_id == doctor_id,
-            Appointment.status == 'accepted',
-            Appointment.start_time < end_dt,
-            Appointment.end_time > start_dt
-        ).first()
-        if overlap:
-            return jsonify({"error": "Time slot already taken"}), 400
-
-        # Handle file upload
+        # Stored before the booking transaction so no lock is held during file I/O
         report_path = None
         if report_file and report_file.filename:
             if not report_file.filename.lower().endswith(('.pdf', '.doc', '.docx', '.jpg', '.jpeg', '.png')):
                 return jsonify({"error": "Unsupported file type"}), 400
-            fn = secure_filename(report_file.filename)
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], fn)
-            report_file.save(file_path)
-            report_path = fn
+            report_path = save_upload(report_file)
 
-        # Create appointment
-        appointment = Appointment(
-            patient_id=patient.id,
-            doctor_id=doctor_id,
-            appointment_type=appointment_type,
-            start_time=start_dt,
-            end_time=end_dt,
-            status='pending' if appointment_type == 'normal' else 'accepted',
-            symptoms=symptoms,
-            report_file=report_path
-        )
-        db.session.add(appointment)
-        db.session.commit()
+        try:
+            book_slot(
+                retries=current_app.config['BOOKING_MAX_RETRIES'],
+                patient_id=identity.patient_id,
+                doctor_id=doctor_id,
+                appointment_type=appointment_type,
+                start_time=start_dt,
+                end_time=end_dt,
+                status='pending' if appointment_type == 'normal' else 'accepted',
+                symptoms=symptoms,
+                report_file=report_path
+            )
+        except SlotTaken:
+            return jsonify({"error": "Time slot already taken"}), 400
         
         return jsonify({"message": "Appointment booked successfully"}), 201
         
+    except RequestEntityTooLarge as e:
+        db.session.rollback()
+        return jsonify({"error": e.description}), 413
     except Exception as e:
         db.session.rollback()
-        print("Booking error:", e)
+        logger.error("Booking error: %s", e)
         return jsonify({"error": "Internal server error"}), 500
     
 @bp.route('/patient/appointments', methods=['GET'])
 @jwt_required()
 def get_patient_appointments():
     try:
-        user_id = int(get_jwt_identity())
-        patient = Patient.query.filter_by(user_id=user_id).first()
-        if not patient:
-            return jsonify({"error": "Patient not found"}), 404
+        identity, error = resolve_identity('patient')
+        if error:
+            return error
 
-        
-        rows = (
-            db.session.query(Appointment, Doctor, Patient)
-            .join(Doctor, Appointment.doctor_id == Doctor.id)
-            .join(Patient, Appointment.patient_id == Patient.id)
-            .filter(Patient.id == patient.id)
-            .all()
-        )
+        version = db.session.query(Patient.appointments_version).filter(Patient.id == identity.patient_id).scalar()
+        tag = etag('patient-appointments', identity.patient_id, version, query=True)
+        unchanged = not_modified(tag)
+        if unchanged:
+            return unchanged
 
-        result = [
-            {
-                "id": appt.id,
-                "doctor_name": doctor.name,
-                "appointment_type": appt.appointment_type,
-                "start_time": appt.start_time.isoformat(),
-                "end_time": appt.end_time.isoformat(),
-                "status": appt.status,
-                "symptoms": appt.symptoms,
-                "report_file": appt.report_file
-            }
-            for appt, doctor, _ in rows
-        ]
-        return jsonify({"appointments": result}), 200
+        try:
+            limit = optional_page_size(
+                request.args.get('limit'),
+                request.args.get('cursor'),
+                current_app.config['APPOINTMENTS_PAGE_SIZE'],
+                current_app.config['MAX_PAGE_SIZE']
+            )
+            rows, next_cursor = keyset_page(
+                db.session.query(Appointment, Doctor.name)
+                .join(Doctor, Appointment.doctor_id == Doctor.id)
+                .filter(Appointment.patient_id == identity.patient_id),
+                Appointment.start_time,
+                Appointment.id,
+                cursor=request.args.get('cursor'),
+                limit=limit,
+                key=lambda row: (row[0].start_time, row[0].id)
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        unread = unread_counts([appt.id for appt, _ in rows], 'patient')
+        result = [patient_appointment(appt, doctor_name, unread.get(appt.id, 0)) for appt, doctor_name in rows]
+        return with_etag(jsonify({
+            "appointments": result,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
+        }), tag)
     except Exception as e:
-        print("Patient appointments error:", e)
+        logger.error("Patient appointments error: %s", e)
         return jsonify({"error": "Failed to fetch appointments"}), 500
     
 
@@ -817,15 +1008,27 @@ def get_patient_appointments():
 def get_doctor_profile(doctor_id):
     """Get detailed doctor profile for patients"""
     try:
-        user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
-        if not user or user.role != 'patient':
-            return jsonify({"error": "Patient access required"}), 403
-
-        doctor = Doctor.query.get_or_404(doctor_id)
-        if not doctor.is_approved or not doctor.user.is_active:
+        identity, error = resolve_identity('patient')
+        if error:
+            return error
+
+        row = (
+            db.session.query(Doctor.version, Doctor.is_approved, User.is_active)
+            .join(User, Doctor.user_id == User.id)
+            .filter(Doctor.id == doctor_id)
+            .first()
+        )
+        if not row:
+            return jsonify({"error": "Doctor not found"}), 404
+        version, is_approved, is_active = row
+        if not is_approved or not is_active:
             return jsonify({"error": "Doctor not available"}), 404
+        tag = etag('doctor', doctor_id, version)
+        unchanged = not_modified(tag)
+        if unchanged:
+            return unchanged
 
+        doctor = Doctor.query.get_or_404(doctor_id)
         doctor_data = {
             "id": doctor.id,
             "name": doctor.name,
@@ -833,7 +1036,7 @@ def get_doctor_profile(doctor_id):
             "instant_available": doctor.instant_available,
             "is_active": doctor.user.is_active,
             "photo": doctor.photo,
-            "availability": json.loads(doctor.availability) if doctor.availability else {},
+            "availability": availability_json(doctor.id, fresh=True),
             "pricing": doctor.pricing or 0.0,
             # You can add more fields like rating, experience, etc.
             "email": doctor.user.email,
@@ -842,10 +1045,10 @@ def get_doctor_profile(doctor_id):
             "location": "Karachi, Pakistan"  # Add this field to Doctor model if needed
         }
         
-        return jsonify({"doctor": doctor_data}), 200
+        return with_etag(jsonify({"doctor": doctor_data}), tag)
         
     except Exception as e:
-        print(f"Error fetching doctor profile: {e}")
+        logger.error("Error fetching doctor profile: %s", e)
         return jsonify({"error": "Failed to fetch doctor profile"}), 500
 
 @bp.route('/patient/doctor-schedule/<int:doctor_id>', methods=['GET'])
@@ -853,10 +1056,9 @@ def get_doctor_profile(doctor_id):
 def get_doctor_schedule(doctor_id):
     """Get doctor's accepted appointments for schedule display"""
     try:
-        user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
-        if not user or user.role != 'patient':
-            return jsonify({"error": "Patient access required"}), 403
+        identity, error = resolve_identity('patient')
+        if error:
+            return error
 
         doctor = Doctor.query.get_or_404(doctor_id)
         if not doctor.is_approved:
@@ -874,46 +1076,51 @@ def get_doctor_schedule(doctor_id):
             Appointment.start_time <= end_date
         ).all()
         
-        appointments_data = [
-            {
-                "id": apt.id,
-                "start_time": apt.start_time.isoformat(),
-                "end_time": apt.end_time.isoformat(),
-                "status": apt.status,
-                "appointment_type": apt.appointment_type
-            }
-            for apt in appointments
-        ]
+        appointments_data = [schedule_fields(apt) for apt in appointments]
         
         return jsonify({"appointments": appointments_data}), 200
         
     except Exception as e:
-        print(f"Error fetching doctor schedule: {e}")
+        logger.error("Error fetching doctor schedule: %s", e)
         return jsonify({"error": "Failed to fetch doctor schedule"}), 500
 
 @bp.route('/patient/profile', methods=['GET', 'POST'])
 @jwt_required()
 def manage_patient_profile():
     try:
-        user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
-        if not user or user.role != 'patient':
-            print("Unauthorized access to patient profile")
-            return jsonify({"error": "Patient access required"}), 403
+        identity, error = resolve_identity('patient')
+        if error:
+            logger.warning("Unauthorized access to patient profile")
+            return error
 
-        patient = Patient.query.filter_by(user_id=user_id).first()
-        if not patient:
+        if request.method == 'GET':
+            version = db.session.query(Patient.version).filter(Patient.id == identity.patient_id).scalar()
+            if version is None:
+                return jsonify({"error": "Patient not found"}), 404
+            tag = etag('patient', identity.patient_id, version)
+            unchanged = not_modified(tag)
+            if unchanged:
+                return unchanged
+
+        row = (
+            db.session.query(Patient, User)
+            .join(User, Patient.user_id == User.id)
+            .filter(Patient.id == identity.patient_id)
+            .first()
+        )
+        if not row:
             return jsonify({"error": "Patient not found"}), 404
+        patient, user = row
 
         if request.method == 'GET':
-            return jsonify({
+            return with_etag(jsonify({
                 "user_id": user.id,  
                 "name": patient.name,
                 "email": user.email,
                 "age": patient.age,
                 "gender": patient.gender,
                 "medical_history": patient.medical_history
-            }), 200
+            }), tag)
 
         if request.method == 'POST':
             data = request.get_json()
@@ -931,12 +1138,13 @@ def manage_patient_profile():
             if medical_history:
                 patient.medical_history = medical_history
 
+            bump_patient(patient.id)
             db.session.commit()
-            print(f"Patient profile updated: {patient.name}")
+            logger.debug("Patient profile updated: %s", patient.name)
             return jsonify({"message": "Profile updated successfully"}), 200
     
     except Exception as e:
-        print(f"Error managing patient profile: {e}")
+        logger.error("Error managing patient profile: %s", e)
         db.session.rollback()
         return jsonify({"error": "Failed to manage profile"}), 500
 
@@ -944,12 +1152,11 @@ def manage_patient_profile():
 @jwt_required()
 def book_instant_appointment():
     try:
-        user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
-        if not user or user.role != 'patient':
-            return jsonify({"error": "Patient access required"}), 403
+        identity, error = resolve_identity('patient')
+        if error:
+            return error
 
-        patient = Patient.query.filter_by(user_id=user_id).first()
+        patient = Patient.query.get(identity.patient_id)
         if not patient:
             return jsonify({"error": "Patient not found"}), 404
 
@@ -969,10 +1176,7 @@ def book_instant_appointment():
         if report_file and report_file.filename:
             if not report_file.filename.lower().endswith(('.pdf', '.doc', '.docx', '.jpg', '.jpeg', '.png')):
                 return jsonify({"error": "Unsupported file type"}), 400
-            fn = secure_filename(report_file.filename)
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], fn)
-            report_file.save(file_path)
-            report_path = fn
+            report_path = save_upload(report_file)
 
         now = datetime.utcnow()
         appointment = Appointment(
@@ -986,32 +1190,23 @@ def book_instant_appointment():
             report_file=report_path
         )
         db.session.add(appointment)
-        db.session.commit()
+        db.session.flush()
+        appointment_id = appointment.id
 
-        from app import socketio
-        socketio.emit('new_appointment_request', {
-            'appointment': {
-                'id': appointment.id,
-                'patient_name': patient.name,
-                'symptoms': appointment.symptoms,
-                'appointment_type': appointment.appointment_type,
-                'start_time': appointment.start_time.isoformat(),
-                'end_time': appointment.end_time.isoformat(),
-                'patient': {
-                    'id': patient.id,
-                    'name': patient.name,
-                    'age': patient.age,
-                    'gender': patient.gender,
-                    'medical_history': patient.medical_history
-                }
-            }
-        }, room=f'doctor_{doctor_id}')
+        notify(db.session, f'doctor_{doctor_id}', 'new_appointment_request', {
+            'appointment': appointment_request(appointment, patient)
+        }, key=appointment_id)
+        bump_appointment_lists(doctor_id, patient.id)
+        db.session.commit()
 
-        return jsonify({"message": "Instant appointment request sent", "appointment_id": appointment.id}), 201
+        return jsonify({"message": "Instant appointment request sent", "appointment_id": appointment_id}), 201
         
+    except RequestEntityTooLarge as e:
+        db.session.rollback()
+        return jsonify({"error": e.description}), 413
     except Exception as e:
         db.session.rollback()
-        print("Instant booking error:", e)
+        logger.error("Instant booking error: %s", e)
         return jsonify({"error": "Internal server error"}), 500
     
 
@@ -1040,4 +1235,4 @@ def debug_appointment(appointment_id):
     
 
     
-print("All routes defined")
+logger.info("All routes defined")
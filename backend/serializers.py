@@ -0,0 +1,58 @@
+"""Shared response shapes for appointments, patients, doctors and chat messages.
+
+Each shape is a fixed field list compiled once into an attrgetter, so turning
+a row into a dict is one C-level call plus a zip. Datetimes stay datetimes;
+fastjson encodes them as ISO 8601 strings.
+"""
+from operator import attrgetter
+
+
+def compile_fields(*fields):
+    """Serializer returning {field: getattr(obj, field)} for a fixed list of two or more fields"""
+    getter = attrgetter(*fields)
+
+    def serialize(obj):
+        return dict(zip(fields, getter(obj)))
+    return serialize
+
+
+appointment_fields = compile_fields(
+    'id', 'appointment_type', 'start_time', 'end_time', 'status', 'symptoms', 'report_file'
+)
+schedule_fields = compile_fields('id', 'start_time', 'end_time', 'status', 'appointment_type')
+patient_fields = compile_fields('id', 'name', 'age', 'gender', 'medical_history')
+doctor_listing_fields = compile_fields('id', 'name', 'specialization', 'instant_available')
+message_fields = compile_fields('id', 'sender_type', 'message', 'sent_at', 'is_read')
+
+
+def doctor_appointment(appointment, patient, unread_count=0):
+    """An appointment as the doctor's dashboard lists it"""
+    item = appointment_fields(appointment)
+    item['patient'] = patient_fields(patient)
+    item['unread_count'] = unread_count
+    return item
+
+
+def patient_appointment(appointment, doctor_name, unread_count=0):
+    """An appointment as the patient's dashboard lists it"""
+    item = appointment_fields(appointment)
+    item['doctor_name'] = doctor_name
+    item['unread_count'] = unread_count
+    return item
+
+
+def appointment_request(appointment, patient):
+    """Payload of the new_appointment_request event sent to the doctor"""
+    item = appointment_fields(appointment)
+    item['patient_name'] = patient.name
+    item['patient'] = patient_fields(patient)
+    return item
+
+
+def doctor_listing(doctor, is_active, availability):
+    """A doctor as the patient-facing directory and search list it"""
+    item = doctor_listing_fields(doctor)
+    item['is_active'] = is_active
+    item['availability'] = availability
+    item['photo'] = doctor.photo or None
+    return item
@@ -0,0 +1,45 @@
+"""Production entry point for the API and Socket.IO server.
+
+    SOCKETIO_ASYNC_MODE=gevent python serve.py --host 0.0.0.0 --port 8000
+
+eventlet and gevent need the standard library patched before anything else
+(sockets, PyMySQL, threading) is imported, which is why this lives outside
+app.py. 'threading' mode runs on Werkzeug and is meant for development.
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+import argparse
+
+from app import app, socketio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', 8000)))
+    args = parser.parse_args()
+
+    socketio.run(
+        app,
+        host=args.host,
+        port=args.port,
+        debug=False,
+        use_reloader=False,
+        log_output=False,
+        allow_unsafe_werkzeug=ASYNC_MODE == 'threading'
+    )
+
+
+if __name__ == '__main__':
+    main()
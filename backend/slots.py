@@ -0,0 +1,125 @@
+from bisect import bisect_right
+from datetime import datetime, date, timedelta
+from models import Appointment
+from booking import BLOCKING_STATUSES
+from availability import WEEKDAYS, get_availability
+
+SLOT_MINUTES = 25
+DEFAULT_WINDOW_DAYS = 7
+MAX_WINDOW_DAYS = 31
+
+
+def merge_intervals(intervals):
+    """Merge (start, end) datetime pairs into sorted, disjoint starts/ends lists for bisecting"""
+    starts, ends = [], []
+    for start, end in sorted(intervals):
+        if ends and start <= ends[-1]:
+            if end > ends[-1]:
+                ends[-1] = end
+            continue
+        starts.append(start)
+        ends.append(end)
+    return starts, ends
+
+
+def is_free(busy, slot_start, slot_end):
+    """Check a slot against merged busy intervals in O(log n)"""
+    starts, ends = busy
+    idx = bisect_right(starts, slot_start) - 1
+    if idx >= 0 and ends[idx] > slot_start:
+        return False
+    if idx + 1 < len(starts) and starts[idx + 1] < slot_end:
+        return False
+    return True
+
+
+def resolve_window(start_date_str=None, end_date_str=None, days=None):
+    """Turn query-string inputs into a [start_date, end_date) window, capped at MAX_WINDOW_DAYS"""
+    start_date = date.fromisoformat(start_date_str) if start_date_str else datetime.utcnow().date()
+    try:
+        if end_date_str:
+            end_date = date.fromisoformat(end_date_str)
+        else:
+            end_date = start_date + timedelta(days=min(int(days), MAX_WINDOW_DAYS) if days else DEFAULT_WINDOW_DAYS)
+        if end_date <= start_date:
+            raise ValueError("end_date must be after start_date")
+        if (end_date - start_date).days > MAX_WINDOW_DAYS:
+            end_date = start_date + timedelta(days=MAX_WINDOW_DAYS)
+    except OverflowError:
+        raise ValueError("date range is out of bounds")
+    return start_date, end_date
+
+
+def compute_slots(compiled, busy, start_date, end_date, slot_minutes=SLOT_MINUTES):
+    """Free slots per date in [start_date, end_date) as {date: ["HH:MM-HH:MM", ...]}"""
+    step = timedelta(minutes=slot_minutes)
+    slots = {}
+    day = start_date
+    while day < end_date:
+        ranges = compiled.get(day.weekday())
+        if ranges:
+            midnight = datetime(day.year, day.month, day.day)
+            day_slots = []
+            for start_minute, end_minute in ranges:
+                current = midnight + timedelta(minutes=start_minute)
+                range_end = midnight + timedelta(minutes=end_minute)
+                while current + step <= range_end:
+                    slot_end = current + step
+                    if is_free(busy, current, slot_end):
+                        day_slots.append(f"{current.strftime('%H:%M')}-{slot_end.strftime('%H:%M')}")
+                    current = slot_end
+            slots[day] = day_slots
+        day += timedelta(days=1)
+    return slots
+
+
+def load_busy_intervals(doctor_ids, start_date, end_date):
+    """Load bookings overlapping the window for many doctors in one query"""
+    window_start = datetime(start_date.year, start_date.month, start_date.day)
+    window_end = datetime(end_date.year, end_date.month, end_date.day)
+    rows = (
+        Appointment.query
+        .with_entities(Appointment.doctor_id, Appointment.start_time, Appointment.end_time)
+        .filter(
+            Appointment.doctor_id.in_(doctor_ids),
+            Appointment.status.in_(BLOCKING_STATUSES),
+            Appointment.start_time < window_end,
+            Appointment.end_time > window_start
+        )
+        .all()
+    )
+    intervals = {doctor_id: [] for doctor_id in doctor_ids}
+    for doctor_id, start, end in rows:
+        intervals[doctor_id].append((start.replace(tzinfo=None), end.replace(tzinfo=None)))
+    return {doctor_id: merge_intervals(pairs) for doctor_id, pairs in intervals.items()}
+
+
+def available_slots_for_doctors(doctor_ids, start_date, end_date, slot_minutes=SLOT_MINUTES):
+    """Batch slot computation: {doctor_id: {date: [slots]}} with a single bookings query"""
+    compiled_by_doctor = {
+        doctor_id: compiled
+        for doctor_id, compiled in get_availability(doctor_ids).items()
+        if compiled
+    }
+    if not compiled_by_doctor:
+        return {}
+    busy_by_doctor = load_busy_intervals(list(compiled_by_doctor), start_date, end_date)
+    return {
+        doctor_id: compute_slots(compiled, busy_by_doctor[doctor_id], start_date, end_date, slot_minutes)
+        for doctor_id, compiled in compiled_by_doctor.items()
+    }
+
+
+def slots_by_weekday(slots_by_date):
+    """Legacy {"Monday": [...]} shape, keeping the first occurrence of each weekday"""
+    by_weekday = {}
+    for day in sorted(slots_by_date):
+        by_weekday.setdefault(WEEKDAYS[day.weekday()], slots_by_date[day])
+    return by_weekday
+
+
+def serialize_slots(slots_by_date):
+    return {
+        "slots": slots_by_weekday(slots_by_date),
+        "dates": {day.isoformat(): day_slots for day, day_slots in sorted(slots_by_date.items())}
+    }
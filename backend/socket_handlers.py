@@ -1,72 +1,225 @@
-from flask import request
+from flask import request, current_app
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_jwt_extended import decode_token
 from models import db, User, Doctor, Patient, Appointment, ChatMessage
+from pagination import encode_cursor, optional_page_size, keyset_page
+from identity import identity_from_claims
+from chat_writer import ChatWriteBehind
+from realtime import LocalPresenceRegistry, create_presence_registry
+from presence import DoctorPresenceWriter
+from receipts import SENDER_FOR_READER, READER_FOR_SENDER, mark_read
+from versions import bump_readers
+from serializers import message_fields
+from log import get_logger
 from datetime import datetime
+import threading
+import time
 
+logger = get_logger('socket')
 
-patient_socket_map = {}
+# sid <-> user_id for every authenticated socket; replaced by init_socket_handlers
+# with the configured registry
+socket_registry = LocalPresenceRegistry()
 
-def get_patient_socket_id(user_id):
-    """Get socket ID for a patient user_id"""
-    return patient_socket_map.get(str(user_id))
+# Set by init_socket_handlers; batches doctors' is_online/last_seen writes
+presence_writer = None
+
+# Set by init_socket_handlers when CHAT_WRITE_MODE is 'write_behind'
+chat_writer = None
+
+# appointment_id -> (session_id, chat_active, patient_id, doctor_id, expires_at)
+_room_cache = {}
+_room_cache_lock = threading.Lock()
+
+# sid -> Identity of each socket this process accepted
+_socket_identities = {}
 
 def get_session_id(patient_id, doctor_id):
     """Generate consistent session ID for patient-doctor pair"""
     return f"session_{min(patient_id, doctor_id)}_{max(patient_id, doctor_id)}"
 
+def cache_appointment_room(appointment_id, patient_id, doctor_id, chat_active):
+    """Remember an appointment's session room and chat state for CHAT_ROOM_CACHE_TTL seconds
+    (CHAT_ROOM_CACHE_SHARED_TTL when other workers may change it)"""
+    session_id = get_session_id(patient_id, doctor_id)
+    config = current_app.config
+    ttl = config['CHAT_ROOM_CACHE_SHARED_TTL'] if config.get('SOCKETIO_MESSAGE_QUEUE') else config['CHAT_ROOM_CACHE_TTL']
+    expires_at = time.monotonic() + ttl
+    with _room_cache_lock:
+        _room_cache[int(appointment_id)] = (session_id, bool(chat_active), patient_id, doctor_id, expires_at)
+    return session_id
+
+def evict_appointment_room(appointment_id):
+    with _room_cache_lock:
+        _room_cache.pop(int(appointment_id), None)
+
+def resolve_appointment_room(appointment_id, fresh=False):
+    """(session_id, chat_active, patient_id, doctor_id) for an appointment, or None.
+
+    Queries only on a cache miss, or always with fresh=True (the result is re-cached).
+    """
+    appointment_id = int(appointment_id)
+    with _room_cache_lock:
+        entry = _room_cache.get(appointment_id)
+        if not fresh and entry and entry[4] > time.monotonic():
+            return entry[:4]
+        _room_cache.pop(appointment_id, None)
+
+    row = (
+        Appointment.query
+        .with_entities(Appointment.patient_id, Appointment.doctor_id, Appointment.chat_active)
+        .filter_by(id=appointment_id)
+        .first()
+    )
+    if not row:
+        return None
+    patient_id, doctor_id, chat_active = row
+    session_id = cache_appointment_room(appointment_id, patient_id, doctor_id, chat_active)
+    return session_id, bool(chat_active), patient_id, doctor_id
+
+def participant_role(room, sid):
+    """'patient' or 'doctor' when the socket's user is on this appointment, otherwise None"""
+    identity = _socket_identities.get(sid)
+    if not identity:
+        return None
+    if identity.role == 'patient' and identity.patient_id == room[2]:
+        return 'patient'
+    if identity.role == 'doctor' and identity.doctor_id == room[3]:
+        return 'doctor'
+    return None
+
+def _message_page(appointment_id, cursor, limit):
+    """One page of chat history walking backwards on (sent_at, id), returned oldest first.
+
+    Without a limit or cursor the whole history is returned, as clients that do
+    not send load-older-messages expect.
+    """
+    if chat_writer:
+        chat_writer.flush()
+    rows, next_cursor = keyset_page(
+        ChatMessage.query.filter_by(appointment_id=appointment_id),
+        ChatMessage.sent_at,
+        ChatMessage.id,
+        cursor=cursor,
+        limit=optional_page_size(limit, cursor, current_app.config['CHAT_PAGE_SIZE'], current_app.config['MAX_PAGE_SIZE'])
+    )
+    return [message_fields(msg) for msg in reversed(rows)], next_cursor
+
+def _messages_since(appointment_id, since_id=None, since_ts=None):
+    """Messages after the client's newest one, oldest first.
+
+    Returns None when there is nothing to anchor on (unknown since_id) or the
+    gap is larger than CHAT_SYNC_MAX_DELTA; the caller then sends a fresh tail.
+    since_ts is inclusive, so a message sharing the timestamp is re-sent rather
+    than lost; clients de-duplicate by id.
+    """
+    if chat_writer:
+        chat_writer.flush()
+    if since_id is not None:
+        try:
+            since_id = int(since_id)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid since_id")
+        anchor_ts = (
+            ChatMessage.query
+            .with_entities(ChatMessage.sent_at)
+            .filter_by(id=since_id, appointment_id=appointment_id)
+            .scalar()
+        )
+        if anchor_ts is None:
+            return None
+        cursor = encode_cursor(anchor_ts, since_id)
+    else:
+        try:
+            cursor = encode_cursor(datetime.fromisoformat(since_ts), 0)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid since_ts")
+
+    rows, more = keyset_page(
+        ChatMessage.query.filter_by(appointment_id=appointment_id),
+        ChatMessage.sent_at,
+        ChatMessage.id,
+        cursor=cursor,
+        limit=current_app.config['CHAT_SYNC_MAX_DELTA'],
+        descending=False
+    )
+    if more:
+        return None
+    return [message_fields(msg) for msg in rows]
+
 def init_socket_handlers(socketio, app, online_doctors, online_patients):
+    global chat_writer, socket_registry, presence_writer
+    socket_registry = create_presence_registry(app.config)
+    presence_writer = DoctorPresenceWriter(
+        app,
+        interval=app.config['PRESENCE_FLUSH_INTERVAL'],
+        registry=socket_registry
+    )
+    presence_writer.start()
+    if app.config.get('CHAT_WRITE_MODE') == 'write_behind':
+        # Each worker's buffer is invisible to the others' history, sync and
+        # mark-read reads until that worker flushes it
+        if app.config.get('SOCKETIO_MESSAGE_QUEUE'):
+            raise RuntimeError("CHAT_WRITE_MODE=write_behind buffers messages per process and cannot be "
+                               "combined with SOCKETIO_MESSAGE_QUEUE; use CHAT_WRITE_MODE=sync")
+        chat_writer = ChatWriteBehind(
+            app,
+            interval_ms=app.config['CHAT_FLUSH_INTERVAL_MS'],
+            batch_size=app.config['CHAT_FLUSH_BATCH_SIZE'],
+            max_pending=app.config['CHAT_MAX_PENDING'],
+            id_block_size=app.config['CHAT_ID_BLOCK_SIZE']
+        )
+        chat_writer.start()
 
     @socketio.on('connect')
     def handle_connect(auth):
         try:
-            print(f"🔌 New connection attempt from {request.sid}")
+            logger.debug("🔌 New connection attempt from %s", request.sid)
             token = auth.get('token') if auth else None
             if not token:
-                print("❌ No token provided")
+                logger.warning("❌ No token provided")
                 return False
 
             with app.app_context():
                 decoded = decode_token(token, allow_expired=False)
                 user_id = int(decoded['sub'])
-                user = User.query.get(user_id)
-                if not user:
-                    print(f"❌ No user found for ID: {user_id}")
+                identity = identity_from_claims(user_id, decoded)
+                if not identity:
+                    logger.warning("❌ No user found for ID: %s", user_id)
                     return False
 
-                print(f"✅ User authenticated: {user.email} (Role: {user.role})")
+                logger.debug("✅ User authenticated: %s (Role: %s)", user_id, identity.role)
                 
                 
-                if user.role == 'doctor':
-                    doctor = Doctor.query.filter_by(user_id=user_id).first()
-                    if doctor:
-                        room_name = f'doctor_{doctor.id}'
+                first = socket_registry.register(user_id, request.sid, identity.role)
+                _socket_identities[request.sid] = identity
+
+                if identity.role == 'doctor':
+                    if identity.doctor_id:
+                        room_name = f'doctor_{identity.doctor_id}'
                         join_room(room_name)
-                        print(f"✅ Doctor joined room: {room_name}")
-                elif user.role == 'patient':
+                        presence_writer.connected(user_id, first)
+                        logger.debug("✅ Doctor joined room: %s", room_name)
+                elif identity.role == 'patient':
                     
-                    patient = Patient.query.filter_by(user_id=user_id).first()
-                    if patient:
+                    if identity.patient_id:
                         
                         room_name = f'patient_{user_id}'
                         join_room(room_name)
                         
-                        
-                        patient_socket_map[str(user_id)] = request.sid
-                        print(f"✅ Patient joined room: {room_name} (user_id: {user_id}, patient_id: {patient.id}, socket_id: {request.sid})")
-                        print(f"📝 Updated patient_socket_map: {patient_socket_map}")
+                        logger.debug("✅ Patient joined room: %s (user_id: %s, patient_id: %s, socket_id: %s)", room_name, user_id, identity.patient_id, request.sid)
                         
                         
                         emit('room_join_confirmation', {
                             'room': room_name,
                             'user_id': user_id,
-                            'patient_id': patient.id,
+                            'patient_id': identity.patient_id,
                             'socket_id': request.sid
                         })
 
             return True
         except Exception as e:
-            print(f"Connection error: {e}")
+            logger.error("Connection error: %s", e)
             return False
 
     @socketio.on('join-session')
@@ -75,44 +228,84 @@ def init_socket_handlers(socketio, app, online_doctors, online_patients):
             with app.app_context():
                 appointment_id = data.get('appointment_id')
                 
-                appointment = Appointment.query.get(appointment_id)
-                if not appointment:
+                # Rejoins after a reconnect are served from the room cache
+                room = resolve_appointment_room(appointment_id)
+                if not room:
                     emit('error', {'message': 'Appointment not found'})
                     return
-
-                
-                patient = Patient.query.get(appointment.patient_id)
-                doctor = Doctor.query.get(appointment.doctor_id)
-                
-                if not patient or not doctor:
-                    emit('error', {'message': 'Patient or doctor not found'})
+                if not participant_role(room, request.sid):
+                    emit('error', {'message': 'Only chat participants can join this session'})
                     return
 
-                session_id = get_session_id(patient.id, doctor.id)
+                session_id = room[0]
                 join_room(session_id)
                 
-                print(f"✅ User joined session: {session_id} for appointment: {appointment_id}")
+                logger.debug("✅ User joined session: %s for appointment: %s", session_id, appointment_id)
                 emit('joined-session', {'session_id': session_id})
 
-                
-                messages = ChatMessage.query.filter_by(appointment_id=appointment_id).order_by(ChatMessage.sent_at).all()
+                # A reconnecting client names its newest message and gets only what it missed
+                since_id, since_ts = data.get('since_id'), data.get('since_ts')
+                if since_id is not None or since_ts:
+                    missed = _messages_since(
+                        appointment_id,
+                        since_id=since_id,
+                        since_ts=since_ts
+                    )
+                    if missed is not None:
+                        emit('missed_messages', {
+                            'appointment_id': appointment_id,
+                            'messages': missed
+                        })
+                        return
+
+                # Otherwise only the most recent page; older history is fetched with load-older-messages
+                messages, next_cursor = _message_page(
+                    appointment_id,
+                    cursor=None,
+                    limit=data.get('limit')
+                )
                 emit('previous_messages', {
-                    'messages': [
-                        {
-                            'id': msg.id,
-                            'sender_type': msg.sender_type,
-                            'message': msg.message,
-                            'sent_at': msg.sent_at.isoformat(),
-                            'is_read': msg.is_read
-                        }
-                        for msg in messages
-                    ]
+                    'appointment_id': appointment_id,
+                    'messages': messages,
+                    'next_cursor': next_cursor,
+                    'has_more': next_cursor is not None
                 })
 
+        except ValueError as e:
+            emit('error', {'message': str(e)})
         except Exception as e:
-            print(f"Error joining session: {e}")
+            logger.error("Error joining session: %s", e)
             emit('error', {'message': 'Failed to join session'})
 
+    @socketio.on('load-older-messages')
+    def handle_load_older_messages(data):
+        try:
+            with app.app_context():
+                appointment_id = data.get('appointment_id')
+                room = resolve_appointment_room(appointment_id)
+                if not room:
+                    emit('error', {'message': 'Appointment not found'})
+                    return
+                if not participant_role(room, request.sid):
+                    emit('error', {'message': 'Only chat participants can load messages'})
+                    return
+                messages, next_cursor = _message_page(
+                    appointment_id,
+                    cursor=data.get('cursor'),
+                    limit=data.get('limit')
+                )
+                emit('older_messages', {
+                    'appointment_id': appointment_id,
+                    'messages': messages,
+                    'next_cursor': next_cursor,
+                    'has_more': next_cursor is not None
+                })
+        except ValueError as e:
+            emit('error', {'message': str(e)})
+        except Exception as e:
+            logger.error("Error loading older messages: %s", e)
+            emit('error', {'message': 'Failed to load messages'})
+
     @socketio.on('send-message')
     def handle_send_message(data):
         try:
@@ -122,66 +315,105 @@ def init_socket_handlers(socketio, app, online_doctors, online_patients):
                 sender_type = data.get('sender_type')
                 sender_id = data.get('sender_id')
 
-                appointment = Appointment.query.get(appointment_id)
-                if not appointment or not appointment.chat_active:
+                # Another worker may have ended the chat; its eviction never reaches this cache
+                room = resolve_appointment_room(appointment_id, fresh=bool(app.config.get('SOCKETIO_MESSAGE_QUEUE')))
+                if not room or not room[1]:
                     emit('error', {'message': 'Chat not active'})
                     return
+                if not participant_role(room, request.sid):
+                    emit('error', {'message': 'Only chat participants can send messages'})
+                    return
+                session_id = room[0]
 
-                
-                chat_message = ChatMessage(
-                    appointment_id=appointment_id,
-                    sender_type=sender_type,
-                    sender_id=sender_id,
-                    message=message_text
-                )
-                db.session.add(chat_message)
-                db.session.commit()
-
-                
-                patient = Patient.query.get(appointment.patient_id)
-                doctor = Doctor.query.get(appointment.doctor_id)
-                session_id = get_session_id(patient.id, doctor.id)
+                if chat_writer:
+                    row = chat_writer.submit(appointment_id, sender_type, sender_id, message_text)
+                    message_id, sent_at = row['id'], row['sent_at']
+                else:
+                    chat_message = ChatMessage(
+                        appointment_id=appointment_id,
+                        sender_type=sender_type,
+                        sender_id=sender_id,
+                        message=message_text
+                    )
+                    db.session.add(chat_message)
+                    db.session.flush()
+                    # read before commit expires the instance, saving a refresh SELECT
+                    message_id, sent_at = chat_message.id, chat_message.sent_at
+                    if sender_type in READER_FOR_SENDER:
+                        bump_readers([appointment_id], READER_FOR_SENDER[sender_type])
+                    db.session.commit()
 
-                
                 socketio.emit('receive-message', {
-                    'id': chat_message.id,
+                    'id': message_id,
                     'sender_type': sender_type,
                     'sender_id': sender_id,
                     'message': message_text,
-                    'sent_at': chat_message.sent_at.isoformat(),
-                    'timestamp': chat_message.sent_at.isoformat()
+                    'sent_at': sent_at.isoformat(),
+                    'timestamp': sent_at.isoformat()
                 }, room=session_id)
 
-                print(f"💬 Message sent to session {session_id}: {message_text[:50]}...")
+                logger.debug("💬 Message sent to session %s: %s...", session_id, message_text[:50])
 
         except Exception as e:
-            print(f"Error sending message: {e}")
+            logger.error("Error sending message: %s", e)
             emit('error', {'message': 'Failed to send message'})
 
+    @socketio.on('mark-read')
+    def handle_mark_read(data):
+        """Read receipt up to a high-water message id; one UPDATE, at most one broadcast"""
+        try:
+            appointment_id = int(data.get('appointment_id'))
+            up_to_id = int(data.get('up_to_id'))
+        except (AttributeError, TypeError, ValueError):
+            emit('error', {'message': 'appointment_id and up_to_id are required'})
+            return
+
+        try:
+            with app.app_context():
+                room = resolve_appointment_room(appointment_id)
+                if not room:
+                    emit('error', {'message': 'Appointment not found'})
+                    return
+                reader_type = participant_role(room, request.sid)
+                if reader_type not in SENDER_FOR_READER:
+                    emit('error', {'message': 'Only chat participants can mark messages read'})
+                    return
+                if chat_writer:
+                    chat_writer.flush()
+                if mark_read(appointment_id, reader_type, up_to_id):
+                    socketio.emit('messages_read', {
+                        'appointment_id': appointment_id,
+                        'reader_type': reader_type,
+                        'up_to_id': up_to_id
+                    }, room=room[0])
+        except Exception as e:
+            logger.error("Error marking messages read: %s", e)
+            db.session.rollback()
+            emit('error', {'message': 'Failed to mark messages read'})
+
     @socketio.on('end_chat')
     def handle_end_chat(data):
         try:
             with app.app_context():
                 appointment_id = data.get('appointment_id')
-                appointment = Appointment.query.get(appointment_id)
+                room = resolve_appointment_room(appointment_id)
                 
-                if appointment:
-                    appointment.chat_active = False
-                    appointment.chat_ended_at = datetime.utcnow()
+                if room:
+                    ended_at = datetime.utcnow()
+                    Appointment.query.filter_by(id=appointment_id).update({
+                        'chat_active': False,
+                        'chat_ended_at': ended_at
+                    })
                     db.session.commit()
-
-                    
-                    patient = Patient.query.get(appointment.patient_id)
-                    doctor = Doctor.query.get(appointment.doctor_id)
-                    session_id = get_session_id(patient.id, doctor.id)
+                    evict_appointment_room(appointment_id)
 
                     socketio.emit('chat_ended', {
                         'appointment_id': appointment_id,
-                        'ended_at': appointment.chat_ended_at.isoformat()
-                    }, room=session_id)
+                        'ended_at': ended_at.isoformat()
+                    }, room=room[0])
 
         except Exception as e:
-            print(f"Error ending chat: {e}")
+            logger.error("Error ending chat: %s", e)
     
     @socketio.on('test_connection')
     def handle_test_connection(data):
@@ -198,7 +430,7 @@ def init_socket_handlers(socketio, app, online_doctors, online_patients):
                     'patient_id': patient.id if patient else None,
                     'user_id': user_id
                 }
-                print(f"🧪 Test connection patient info: {patient_info}")
+                logger.debug("🧪 Test connection patient info: %s", patient_info)
             
             emit('connection_test_result', [
                 {
@@ -207,16 +439,23 @@ def init_socket_handlers(socketio, app, online_doctors, online_patients):
                     'patient_info': patient_info if 'patient_info' in locals() else None
                 }
             ])
-            print(f"🧪 Test: Patient {user_id} joined room {room_name}")
+            logger.debug("🧪 Test: Patient %s joined room %s", user_id, room_name)
 
     @socketio.on('disconnect')
     def handle_disconnect():
-        print(f"🔴 Client disconnected: {request.sid}")
+        logger.debug("🔴 Client disconnected: %s", request.sid)
         
         
-        for user_id, socket_id in list(patient_socket_map.items()):
-            if socket_id == request.sid:
-                del patient_socket_map[user_id]
-                print(f"🗑️ Removed patient socket mapping for user_id: {user_id}")
-                print(f"📝 Updated patient_socket_map: {patient_socket_map}")
-                break
\ No newline at end of file
+        _socket_identities.pop(request.sid, None)
+        entry = socket_registry.unregister(request.sid)
+        if entry is not None:
+            user_id, role, last = entry
+            if role == 'doctor':
+                presence_writer.disconnected(user_id, last)
+            logger.debug("🗑️ Removed socket mapping for user_id: %s (last: %s)", user_id, last)
+
+    @socketio.on('heartbeat')
+    def handle_heartbeat(data=None):
+        entry = socket_registry.user_for(request.sid)
+        if entry and entry[1] == 'doctor':
+            presence_writer.heartbeat(entry[0])
\ No newline at end of file
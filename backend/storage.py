@@ -0,0 +1,150 @@
+from flask import Request, Response, current_app, request, send_file
+from werkzeug.exceptions import NotFound, RequestEntityTooLarge
+from werkzeug.security import safe_join
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+DOCUMENT_EXTENSIONS = ('.pdf', '.doc', '.docx')
+# <aa>/<bb>/<sha256><ext> paths written by save_upload(); their bytes never change
+CONTENT_ADDRESSED_PATH = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.[A-Za-z0-9]+$')
+
+
+def max_bytes_for(filename):
+    """Per-type size cap, chosen by extension"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext in PHOTO_EXTENSIONS:
+        return current_app.config['UPLOAD_MAX_PHOTO_BYTES']
+    return current_app.config['UPLOAD_MAX_DOCUMENT_BYTES']
+
+
+def _incoming_dir():
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], '.incoming')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class HashingUploadStream:
+    """Spool target for one multipart file part.
+
+    Werkzeug writes the part into this as it parses the body, so the upload is
+    hashed on the fly and rejected with 413 as soon as it passes its cap. The
+    temp file lives inside UPLOAD_FOLDER so save_upload() can hard-link it into
+    place without copying.
+    """
+
+    def __init__(self, max_bytes):
+        self._file = tempfile.NamedTemporaryFile(dir=_incoming_dir(), prefix='upload-')
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.max_bytes = max_bytes
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self._file.close()
+            raise RequestEntityTooLarge(f"File exceeds {self.max_bytes} bytes")
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+class UploadRequest(Request):
+    """Request class that streams file parts into HashingUploadStream"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingUploadStream(max_bytes_for(filename))
+
+
+def save_upload(file):
+    """Store an uploaded file by content hash and return its path relative to UPLOAD_FOLDER.
+
+    Files land in <aa>/<bb>/<sha256><ext>, so identical uploads share one file and
+    two different 'report.pdf' uploads can no longer overwrite each other.
+    """
+    stream = file.stream
+    if not isinstance(stream, HashingUploadStream):
+        # Not parsed by UploadRequest (e.g. constructed by hand); copy through a hashing stream
+        stream = HashingUploadStream(max_bytes_for(file.filename))
+        while True:
+            chunk = file.stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            stream.write(chunk)
+    stream.flush()
+
+    digest = stream.hexdigest()
+    ext = os.path.splitext(file.filename or '')[1].lower()
+    relative = '/'.join([digest[:2], digest[2:4], digest + ext])
+    destination = os.path.join(current_app.config['UPLOAD_FOLDER'], digest[:2], digest[2:4], digest + ext)
+
+    if not os.path.exists(destination):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            os.link(stream.name, destination)
+        except FileExistsError:
+            pass
+        except OSError:
+            stream.seek(0)
+            with open(destination + '.part', 'wb') as out:
+                shutil.copyfileobj(stream, out, CHUNK_SIZE)
+            os.replace(destination + '.part', destination)
+    return relative
+
+
+def send_upload(relative):
+    """Serve a stored upload with validators, caching and Range support.
+
+    Content-addressed files get their hash as a strong ETag and a year-long
+    immutable Cache-Control; legacy flat files get an mtime/size ETag and a short
+    max-age. Caching is private because reports are patient data. With
+    UPLOAD_SENDFILE_MODE set, only headers are produced and the front proxy
+    streams the bytes (and handles Range itself).
+    """
+    path = safe_join(current_app.config['UPLOAD_FOLDER'], relative)
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+
+    match = CONTENT_ADDRESSED_PATH.match(relative)
+    if match:
+        etag, max_age = match.group(1), current_app.config['UPLOAD_IMMUTABLE_MAX_AGE']
+    else:
+        stat = os.stat(path)
+        etag, max_age = f"{int(stat.st_mtime)}-{stat.st_size}", current_app.config['UPLOAD_CACHE_MAX_AGE']
+
+    mode = current_app.config.get('UPLOAD_SENDFILE_MODE')
+    if not mode:
+        response = send_file(path, conditional=True, etag=etag, max_age=max_age)
+    else:
+        response = Response(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        if mode == 'x-accel-redirect':
+            response.headers['X-Accel-Redirect'] = current_app.config['UPLOAD_ACCEL_PREFIX'].rstrip('/') + '/' + relative
+        else:
+            response.headers['X-Sendfile'] = path
+        response.set_etag(etag)
+        response.last_modified = os.path.getmtime(path)
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            response.headers.pop('X-Sendfile', None)
+            response.headers.pop('X-Accel-Redirect', None)
+
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.no_cache = None
+    response.cache_control.max_age = max_age
+    if match:
+        response.cache_control.immutable = True
+    return response
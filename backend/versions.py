@@ -0,0 +1,76 @@
+"""Per-entity version counters and the ETags built from them.
+
+Doctor.version and Patient.version cover a profile; appointments_version
+covers the appointment list that doctor or patient sees, unread counts
+included. Writers bump them in the same transaction as the change with
+UPDATE ... SET x = x + 1, so every worker agrees on the current value and an
+unchanged GET is answered with a 304 after one primary-key lookup.
+"""
+from flask import request, current_app
+from models import db, Doctor, Patient, Appointment
+from sqlalchemy import select, update
+import hashlib
+
+
+def _bump(column, id_column, ids):
+    db.session.execute(
+        update(column.class_)
+        .where(id_column.in_(ids))
+        .values({column.key: column + 1})
+        .execution_options(synchronize_session=False)
+    )
+
+
+def bump_doctors(doctor_ids):
+    """Doctor profiles changed (also covers is_active/is_approved, which they show)"""
+    _bump(Doctor.version, Doctor.id, doctor_ids)
+
+
+def bump_patient(patient_id):
+    """A patient profile changed; doctors' lists embed it, so theirs change too"""
+    _bump(Patient.version, Patient.id, [patient_id])
+    _bump(Doctor.appointments_version, Doctor.id,
+          select(Appointment.doctor_id).where(Appointment.patient_id == patient_id))
+
+
+def bump_doctor_name(doctor_id):
+    """Patients' lists show the doctor's name"""
+    _bump(Patient.appointments_version, Patient.id,
+          select(Appointment.patient_id).where(Appointment.doctor_id == doctor_id))
+
+
+def bump_appointment_lists(doctor_id, patient_id):
+    """An appointment between the two was created or changed status"""
+    _bump(Doctor.appointments_version, Doctor.id, [doctor_id])
+    _bump(Patient.appointments_version, Patient.id, [patient_id])
+
+
+def bump_readers(appointment_ids, reader_type):
+    """Unread counts changed for the doctor or patient side of these appointments"""
+    if reader_type == 'doctor':
+        _bump(Doctor.appointments_version, Doctor.id,
+              select(Appointment.doctor_id).where(Appointment.id.in_(appointment_ids)))
+    else:
+        _bump(Patient.appointments_version, Patient.id,
+              select(Appointment.patient_id).where(Appointment.id.in_(appointment_ids)))
+
+
+def etag(*parts, query=False):
+    """Entity tag from version stamps; query=True folds in the query string (paging, filters)"""
+    if query and request.query_string:
+        parts += (hashlib.blake2b(request.query_string, digest_size=8).hexdigest(),)
+    return '-'.join(str(part) for part in parts)
+
+
+def not_modified(tag):
+    """A 304 response when If-None-Match already has `tag`, otherwise None"""
+    if tag in request.if_none_match:
+        return with_etag(current_app.response_class(status=304), tag)
+    return None
+
+
+def with_etag(response, tag):
+    response.set_etag(tag)
+    # Let browsers keep the body but revalidate on every poll
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response